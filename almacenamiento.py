@@ -0,0 +1,310 @@
+'''
+Motores de almacenamiento para GestionProductos
+
+Cada motor entrega conexiones con la misma interfaz que usan los métodos CRUD
+(connection.cursor(dictionary=...), consultas con %s, commit, rollback, close, is_connected):
+- BackendMySQL: MySQL a través de un pool de conexiones
+- BackendSQLite: base embebida en un archivo, sin servidor (modo WAL)
+'''
+# Librerías necesarias
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+from mysql.connector.pooling import MySQLConnectionPool
+from decouple import config
+
+# Errores de base de datos de cualquiera de los motores (para usar en except)
+Error = (mysql.connector.Error, sqlite3.Error)
+
+# Formatos aceptados para las fechas de vencimiento
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+# SQLite guarda las fechas como texto AAAA-MM-DD (el adaptador por defecto de sqlite3 está obsoleto desde Python 3.12)
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+
+# Pool de conexiones
+class PoolConexiones(MySQLConnectionPool):
+    '''
+    Pool de mysql.connector que, en lugar de fallar cuando se agota,
+    espera hasta timeout segundos a que se libere una conexión y registra cuánto se esperó.
+    El pool de mysql.connector ya verifica (is_connected) y reconecta cada conexión al entregarla
+    '''
+    def __init__(self, pool_size, timeout, **kwargs) -> None:
+        self.timeout = timeout
+        self._disponibles = threading.BoundedSemaphore(pool_size)
+        self._lock_estadisticas = threading.Lock()
+        self._pedidos = 0
+        self._espera_total = 0.0
+        self._espera_maxima = 0.0
+        super().__init__(pool_size=pool_size, pool_reset_session=True, **kwargs)
+
+    def get_connection(self):
+        inicio = time.perf_counter()
+        if not self._disponibles.acquire(timeout=self.timeout):
+            raise PoolError(f'No se liberó ninguna conexión del pool en {self.timeout} segundos')
+        espera = time.perf_counter() - inicio
+
+        with self._lock_estadisticas:
+            self._pedidos += 1
+            self._espera_total += espera
+            self._espera_maxima = max(self._espera_maxima, espera)
+
+        try:
+            return super().get_connection()
+        except Exception:
+            self._disponibles.release()
+            raise
+
+    def add_connection(self, cnx=None):
+        '''
+        Se llama al crear el pool (cnx=None) y al cerrar una conexión prestada (cnx devuelta al pool)
+        '''
+        super().add_connection(cnx)
+        if cnx is not None:
+            self._disponibles.release()
+
+    def estadisticas(self):
+        '''
+        Devuelve los tiempos de espera (en segundos) para obtener una conexión del pool
+        '''
+        with self._lock_estadisticas:
+            return {
+                'pool_size': self.pool_size,
+                'pedidos': self._pedidos,
+                'espera_total': self._espera_total,
+                'espera_promedio': self._espera_total / self._pedidos if self._pedidos else 0.0,
+                'espera_maxima': self._espera_maxima,
+            }
+
+# Motor MySQL
+class BackendMySQL():
+    def __init__(self) -> None:
+        self.host = config('DB_HOST')
+        self.name = config('DB_NAME')
+        self.user = config('DB_USER')
+        self.password = config('DB_PASS')
+        self.port = config('DB_PORT')
+        self.pool_size = config('DB_POOL_SIZE', default=5, cast=int) ### mysql.connector admite hasta 32
+        self.pool_timeout = config('DB_POOL_TIMEOUT', default=10, cast=float)
+        self.pool = None
+        self._lock_pool = threading.Lock()
+
+    def obtener_pool(self):
+        '''
+        Crea el pool de conexiones la primera vez que se necesita
+        '''
+        with self._lock_pool:
+            if self.pool is None:
+                self.pool = PoolConexiones(
+                    pool_size = self.pool_size,
+                    timeout = self.pool_timeout,
+                    host = self.host,
+                    database = self.name,
+                    user = self.user,
+                    password = self.password,
+                    port = self.port
+                )
+            return self.pool
+
+    def __reduce__(self):
+        return (BackendMySQL, ()) ### En otro proceso (exportar.py) se arma de nuevo con su propio pool
+
+    def connect(self):
+        '''
+        Obtiene una conexión del pool. Al cerrarla (connection.close()) vuelve al pool
+        '''
+        return self.obtener_pool().get_connection()
+
+    def estadisticas(self):
+        return self.pool.estadisticas() if self.pool else None
+
+# Motor SQLite
+@lru_cache(maxsize=512)
+def traducir_consulta(consulta):
+    '''
+    Pasa una consulta escrita para MySQL al dialecto de SQLite:
+    marcadores %s -> ? y sin FOR UPDATE (se reemplaza por BEGIN IMMEDIATE en el cursor).
+    Devuelve (consulta, si pedía FOR UPDATE)
+    '''
+    bloquear = re.search(r'\sFOR UPDATE\s*$', consulta, re.IGNORECASE) is not None
+    if bloquear:
+        consulta = re.sub(r'\sFOR UPDATE\s*$', '', consulta, flags=re.IGNORECASE)
+    return consulta.replace('%s', '?'), bloquear
+
+def _fila_como_dict(cursor, fila):
+    return {columna[0]: valor for columna, valor in zip(cursor.description, fila)}
+
+class CursorSQLite():
+    '''
+    Cursor de sqlite3 con la interfaz del cursor de mysql.connector que usan los métodos CRUD
+    '''
+    def __init__(self, connection, dictionary=False) -> None:
+        self._connection = connection
+        self._cursor = connection.cursor()
+        if dictionary:
+            self._cursor.row_factory = _fila_como_dict
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, consulta, parametros=()):
+        consulta, bloquear = traducir_consulta(consulta)
+        ### SQLite bloquea la base entera: BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer
+        if bloquear and not self._connection.in_transaction:
+            self._connection.execute('BEGIN IMMEDIATE')
+        self._cursor.execute(consulta, tuple(parametros))
+        return self
+
+    def executemany(self, consulta, parametros):
+        consulta, _ = traducir_consulta(consulta)
+        self._cursor.executemany(consulta, parametros)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, tamano):
+        return self._cursor.fetchmany(tamano)
+
+    def close(self):
+        self._cursor.close()
+
+class ConexionSQLite():
+    '''
+    Conexión de sqlite3 con la interfaz de las conexiones de mysql.connector.
+    Cada hilo tiene la suya y la reutiliza: close() sólo descarta lo que no se guardó, como al devolverla a un pool
+    '''
+    def __init__(self, connection) -> None:
+        self._connection = connection
+
+    def cursor(self, dictionary=False):
+        return CursorSQLite(self._connection, dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        if self._connection.in_transaction:
+            self._connection.rollback()
+
+def esquema_sqlite(ruta_sql):
+    '''
+    Devuelve las sentencias CREATE TABLE / CREATE INDEX de products.sql (SQLite acepta sus tipos)
+    con IF NOT EXISTS, así en una base ya creada sólo se agregan las tablas e índices nuevos,
+    y los INSERT de filas fijas con OR IGNORE
+    '''
+    with open(ruta_sql, encoding='utf-8') as archivo:
+        texto = '\n'.join(linea.rstrip('\n').split('--')[0] for linea in archivo)
+
+    sentencias = []
+    for sentencia in texto.split(';'):
+        sentencia = sentencia.strip()
+        if re.match(r'CREATE\s+(TABLE|INDEX)', sentencia, re.IGNORECASE):
+            sentencia = re.sub(r'^CREATE\s+(TABLE|INDEX)', r'CREATE \1 IF NOT EXISTS', sentencia, flags=re.IGNORECASE)
+            sentencia = re.sub(r'\bauto_increment\b', 'autoincrement', sentencia, flags=re.IGNORECASE) ### Así se escribe en SQLite
+            sentencias.append(sentencia)
+        elif re.match(r'INSERT\s+INTO', sentencia, re.IGNORECASE):
+            sentencias.append(re.sub(r'^INSERT\s+INTO', 'INSERT OR IGNORE INTO', sentencia, flags=re.IGNORECASE))
+    return sentencias
+
+def convertir_vencimientos(connection):
+    '''
+    Pasa a AAAA-MM-DD los vencimientos guardados como texto en otro formato (DD/MM/AAAA, DD-MM-AAAA) por bases
+    anteriores a la columna date: SQLite compara las fechas como texto y los filtros y el orden por vencimiento
+    sólo funcionan con fechas ISO. Los que no se pueden convertir se informan y quedan como están
+    '''
+    filas = connection.execute("SELECT codigo, vencimiento FROM productoalimenticio "
+                               "WHERE vencimiento NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'").fetchall()
+    sin_convertir = []
+    for codigo, vencimiento in filas:
+        for formato in FORMATOS_FECHA:
+            try:
+                fecha = datetime.datetime.strptime(str(vencimiento).strip(), formato).date()
+            except ValueError:
+                continue
+            connection.execute('UPDATE productoalimenticio SET vencimiento = ? WHERE codigo = ?', (fecha.isoformat(), codigo))
+            break
+        else:
+            sin_convertir.append(f'{codigo} ({vencimiento})')
+    if sin_convertir:
+        print(f'Vencimientos que no se pudieron convertir a AAAA-MM-DD (corregirlos a mano): {", ".join(sin_convertir)}')
+
+class BackendSQLite():
+    def __init__(self, ruta=None) -> None:
+        self.ruta = ruta or config('DB_SQLITE_PATH', default='inventario.db')
+        self.timeout = config('DB_POOL_TIMEOUT', default=10, cast=float)
+        self._local = threading.local()
+        self._lock_esquema = threading.Lock()
+        self._esquema_creado = False
+
+    def __reduce__(self):
+        return (BackendSQLite, (self.ruta,)) ### En otro proceso (exportar.py) abre sus propias conexiones
+
+    def _crear_esquema(self, connection):
+        with self._lock_esquema:
+            if self._esquema_creado:
+                return
+            for sentencia in esquema_sqlite(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'products.sql')):
+                connection.execute(sentencia)
+            convertir_vencimientos(connection)
+            connection.commit()
+            self._esquema_creado = True
+
+    def connect(self):
+        '''
+        Devuelve la conexión del hilo actual (la abre la primera vez)
+        '''
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            ### cached_statements: sqlite3 reutiliza las consultas ya preparadas
+            connection = sqlite3.connect(self.ruta, timeout=self.timeout, cached_statements=256)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute('PRAGMA foreign_keys = ON')
+            self._crear_esquema(connection)
+            self._local.connection = connection
+        return ConexionSQLite(connection)
+
+    def estadisticas(self):
+        return None
+
+def crear_backend():
+    '''
+    Elige el motor según DB_BACKEND (mysql por defecto o sqlite)
+    '''
+    motor = config('DB_BACKEND', default='mysql').lower()
+    if motor == 'mysql':
+        return BackendMySQL()
+    elif motor == 'sqlite':
+        return BackendSQLite()
+    raise ValueError(f'DB_BACKEND desconocido: {motor} (opciones: mysql, sqlite)')
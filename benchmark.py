@@ -0,0 +1,406 @@
+'''
+Benchmarks del sistema de inventario
+
+Se ejecuta contra la BBDD configurada en .env:
+    python benchmark.py [nombre ...]
+
+El benchmark crud genera su propio catálogo sintético y por defecto usa una base SQLite temporal
+(no necesita ningún servidor). Guarda los resultados en JSON para comparar versiones:
+    python benchmark.py crud --filas 1000 100000 --clientes 1 8 --salida resultados.json
+'''
+# Librerías necesarias
+import argparse
+import asyncio
+import contextlib
+import datetime
+import functools
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from almacenamiento import BackendMySQL, BackendSQLite
+from exportar import exportar_paralelo
+
+from inventory import (
+    Producto,
+    ProductoElectronico,
+    ProductoAlimenticio,
+    GestionProductos
+)
+
+class ContadorConsultas():
+    '''
+    Envuelve GestionProductos.connect para contar los viajes (execute) a la BBDD
+    '''
+    def __init__(self, gestion: GestionProductos) -> None:
+        self.gestion = gestion
+        self.consultas = 0
+        self._connect_original = gestion.connect
+
+    def __enter__(self):
+        def connect():
+            connection = self._connect_original()
+            if connection:
+                cursor_original = connection.cursor
+
+                def cursor(*args, **kwargs):
+                    cursor = cursor_original(*args, **kwargs)
+                    execute_original = cursor.execute
+
+                    def execute(*args, **kwargs):
+                        self.consultas += 1
+                        return execute_original(*args, **kwargs)
+
+                    cursor.execute = execute
+                    return cursor
+
+                connection.cursor = cursor
+            return connection
+
+        self.gestion.connect = connect
+        return self
+
+    def __exit__(self, *args):
+        self.gestion.connect = self._connect_original
+
+def leer_todos_n_mas_1(gestion: GestionProductos):
+    '''
+    Implementación anterior de leer_todos_los_productos (una o dos consultas extra por producto)
+    Se conserva sólo para comparar
+    '''
+    connection = gestion.connect()
+    try:
+        with connection.cursor(dictionary=True) as cursor:
+            cursor.execute('SELECT * FROM producto')
+            productos = []
+            for producto_data in cursor.fetchall():
+                codigo = producto_data['codigo']
+                cursor.execute('SELECT categoria FROM productoelectronico WHERE codigo = %s', (codigo,))
+                categoria = cursor.fetchone()
+                if categoria:
+                    productos.append(ProductoElectronico(**producto_data, categoria=categoria['categoria']))
+                else:
+                    cursor.execute('SELECT vencimiento FROM productoalimenticio WHERE codigo = %s', (codigo,))
+                    vencimiento = cursor.fetchone()
+                    productos.append(ProductoAlimenticio(**producto_data, vencimiento=vencimiento['vencimiento']))
+            return productos
+    finally:
+        connection.close()
+
+def medir(nombre, gestion: GestionProductos, funcion):
+    with ContadorConsultas(gestion) as contador:
+        inicio = time.perf_counter()
+        productos = funcion()
+        duracion = time.perf_counter() - inicio
+    print(f'{nombre:<30} {len(productos):>10} productos {contador.consultas:>10} consultas {duracion:>10.3f} s')
+
+def benchmark_leer_todos(gestion: GestionProductos):
+    print('=== leer_todos_los_productos ===')
+    medir('N+1 (anterior)', gestion, lambda: leer_todos_n_mas_1(gestion))
+    medir('LEFT JOIN', gestion, gestion.leer_todos_los_productos)
+
+class ProductoElectronicoAnterior():
+    '''
+    Representación anterior: atributos en el __dict__ de cada instancia y validación en cada construcción
+    '''
+    def __init__(self, codigo, nombre, costo, precio, cantidad, categoria) -> None:
+        self.codigo = Producto.validar_codigo(self, codigo)
+        self.nombre = Producto.validar_nombre(self, nombre)
+        self.costo = Producto.validar_costo(self, costo)
+        self.precio = Producto.validar_precio(self, precio)
+        self.cantidad = Producto.validar_cantidad(self, cantidad)
+        self.categoria = categoria
+
+def medir_objetos(nombre, construir, cantidad):
+    ### El tiempo se mide sin tracemalloc (que lo distorsiona) y la memoria en una segunda pasada
+    inicio = time.perf_counter()
+    productos = [construir(codigo) for codigo in range(1, cantidad + 1)]
+    duracion = time.perf_counter() - inicio
+    del productos
+
+    tracemalloc.start()
+    productos = [construir(codigo) for codigo in range(1, cantidad + 1)]
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{nombre:<30} {len(productos):>10} objetos {memoria / len(productos):>10.0f} bytes/obj {duracion:>10.3f} s')
+
+def benchmark_objetos(cantidad=200_000):
+    print('=== Construcción de productos (sin BBDD) ===')
+    medir_objetos('Anterior (__dict__ + validar)', lambda codigo: ProductoElectronicoAnterior(codigo, 'Producto', 10.0, 15.0, 5, 'audio'), cantidad)
+    medir_objetos('__slots__ + validar', lambda codigo: ProductoElectronico(codigo, 'Producto', 10.0, 15.0, 5, 'audio'), cantidad)
+    medir_objetos('__slots__ + desde_bd', lambda codigo: ProductoElectronico.desde_bd(codigo, 'Producto', 10.0, 15.0, 5, 'audio'), cantidad)
+
+def benchmark_stock(gestion: GestionProductos, hilos=8, ajustes_por_hilo=200, codigo=99999901, diferido=False):
+    '''
+    Varios hilos suman y restan stock al mismo producto a la vez.
+    Si no se pierde ninguna actualización la cantidad final es la inicial más la suma de los deltas.
+    Con diferido=True los ajustes pasan por la escritura diferida (journal local y un commit por lote)
+    '''
+    print(f'=== ajustar_stock concurrente{" (escritura diferida)" if diferido else ""} ===')
+    cantidad_inicial = 1000
+    gestion.eliminar_producto(codigo)
+    gestion.crear_producto(ProductoElectronico(codigo, 'Producto de prueba', 10.0, 15.0, cantidad_inicial, 'benchmark'))
+    directorio = tempfile.TemporaryDirectory()
+    if diferido:
+        gestion.activar_stock_diferido(directorio=directorio.name)
+
+    fallidos = []
+    def trabajar(numero_hilo):
+        for i in range(ajustes_por_hilo):
+            delta = 2 if (numero_hilo + i) % 2 == 0 else -1
+            if gestion.ajustar_stock(codigo, delta) is None:
+                fallidos.append(delta)
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajar, args=(numero,)) for numero in range(hilos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join()
+    duracion = time.perf_counter() - inicio
+
+    esperado = cantidad_inicial + sum(2 if (numero + i) % 2 == 0 else -1 for numero in range(hilos) for i in range(ajustes_por_hilo)) - sum(fallidos)
+    final = gestion.leer_producto(codigo).cantidad
+    total = hilos * ajustes_por_hilo
+    print(f'{total} ajustes con {hilos} hilos en {duracion:.3f} s ({total / duracion:.0f} ajustes/s), {len(fallidos)} fallidos')
+    print(f'Cantidad final {final}, esperada {esperado}: {"OK" if final == esperado else "SE PERDIERON ACTUALIZACIONES"}')
+
+    if diferido:
+        gestion.stock_diferido.cerrar()
+        estadisticas = gestion.estadisticas_stock_diferido()
+        latencia = estadisticas['latencia_vaciado']
+        print(f'{estadisticas["vaciados"]} vaciados, {estadisticas["filas_escritas"]} filas escritas, '
+              f'coalescencia {estadisticas["coalescencia"]:.1f} ajustes por fila, '
+              f'vaciado promedio {latencia["promedio_ms"]:.2f} ms (p99 {latencia["p99_ms"]} ms)')
+        gestion.stock_diferido = None
+        guardado = gestion.leer_producto(codigo).cantidad
+        print(f'Cantidad guardada en la BBDD {guardado}: {"OK" if guardado == esperado else "NO COINCIDE"}')
+    gestion.eliminar_producto(codigo)
+    directorio.cleanup()
+
+def benchmark_async(gestion: GestionProductos, consultas=5000, hilos=64):
+    '''
+    Compara búsquedas concurrentes por código: GestionProductos con un hilo por pedido
+    contra AsyncGestionProductos con asyncio (ambos con DB_POOL_SIZE conexiones)
+    '''
+    from inventory_async import AsyncGestionProductos ### aiomysql sólo se necesita para este benchmark
+
+    print('=== leer_producto concurrente: hilos vs asyncio ===')
+    codigos = [producto.codigo for producto in itertools.islice(gestion.iterar_productos(), 1000)]
+    if not codigos:
+        print('No hay productos cargados')
+        return
+    pedidos = [codigos[i % len(codigos)] for i in range(consultas)]
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        list(ejecutor.map(gestion.leer_producto, pedidos))
+    duracion = time.perf_counter() - inicio
+    print(f'{"Sincrónico (" + str(hilos) + " hilos)":<30} {consultas:>10} consultas {duracion:>10.3f} s {consultas / duracion:>10.0f} consultas/s')
+
+    async def correr():
+        gestion_async = AsyncGestionProductos()
+        try:
+            await gestion_async.obtener_pool()
+            inicio = time.perf_counter()
+            await asyncio.gather(*(gestion_async.leer_producto(codigo) for codigo in pedidos))
+            return time.perf_counter() - inicio
+        finally:
+            await gestion_async.cerrar()
+
+    duracion = asyncio.run(correr())
+    print(f'{"asyncio":<30} {consultas:>10} consultas {duracion:>10.3f} s {consultas / duracion:>10.0f} consultas/s')
+
+## Carga sintética
+NOMBRES = ['Televisor', 'Notebook', 'Auriculares', 'Parlante', 'Monitor', 'Mouse', 'Teclado', 'Celular',
+           'Arroz', 'Fideos', 'Leche', 'Yerba', 'Galletitas', 'Aceite', 'Harina', 'Azúcar']
+CATEGORIAS = ['audio', 'video', 'computación', 'telefonía', 'accesorios']
+
+def generar_productos(cantidad, desde_codigo=1, semilla=0):
+    '''
+    Genera filas de productos electrónicos y alimenticios (mitad y mitad) listas para crear_productos_bulk
+    '''
+    aleatorio = random.Random(semilla)
+    hoy = datetime.date.today()
+    for codigo in range(desde_codigo, desde_codigo + cantidad):
+        costo = round(aleatorio.uniform(1, 1000), 2)
+        fila = {
+            'codigo': codigo,
+            'nombre': f'{aleatorio.choice(NOMBRES)} {codigo}',
+            'costo': costo,
+            'precio': round(costo * aleatorio.uniform(1.05, 1.8), 2),
+            'cantidad': aleatorio.randint(0, 500),
+        }
+        if codigo % 2:
+            fila['categoria'] = aleatorio.choice(CATEGORIAS)
+        else:
+            fila['vencimiento'] = (hoy + datetime.timedelta(days=aleatorio.randint(1, 720))).isoformat()
+        yield fila
+
+def percentiles_ms(latencias):
+    ordenadas = sorted(latencias)
+    def percentil(p):
+        return ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))] * 1000
+    return {
+        'promedio': sum(ordenadas) / len(ordenadas) * 1000,
+        'p50': percentil(50),
+        'p90': percentil(90),
+        'p99': percentil(99),
+        'maximo': ordenadas[-1] * 1000,
+    }
+
+def medir_operacion(nombre, operacion, argumentos, clientes):
+    '''
+    Reparte las llamadas operacion(*argumento) entre clientes hilos y mide cada una
+    '''
+    latencias = []
+    lock = threading.Lock()
+
+    def llamar(argumento):
+        inicio = time.perf_counter()
+        operacion(*argumento)
+        duracion = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracion)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clientes) as ejecutor:
+        list(ejecutor.map(llamar, argumentos))
+    segundos = time.perf_counter() - inicio
+
+    return {
+        'operacion': nombre,
+        'clientes': clientes,
+        'operaciones': len(latencias),
+        'segundos': segundos,
+        'operaciones_por_segundo': len(latencias) / segundos if segundos else 0.0,
+        'latencia_ms': percentiles_ms(latencias),
+    }
+
+def nueva_gestion(motor, ruta_sqlite):
+    '''
+    sqlite: una base nueva en ruta_sqlite / mysql: la base del .env (se BORRAN todos sus productos)
+    '''
+    if motor == 'sqlite':
+        return GestionProductos(BackendSQLite(ruta_sqlite))
+    gestion = GestionProductos(BackendMySQL())
+    gestion.eliminar_registros()
+    return gestion
+
+def benchmark_crud(filas=(1000, 10_000), clientes=(1, 4), operaciones=2000, lecturas_completas=3, motor='sqlite', salida=None, semilla=0):
+    print(f'=== CRUD ({motor}) ===')
+    aleatorio = random.Random(semilla)
+    resultados = []
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for cantidad_filas in filas:
+            for cantidad_clientes in clientes:
+                with contextlib.redirect_stdout(io.StringIO()): ### Los métodos CRUD imprimen cada resultado
+                    gestion = nueva_gestion(motor, os.path.join(directorio, f'{cantidad_filas}_{cantidad_clientes}.db'))
+                    carga = gestion.crear_productos_bulk(generar_productos(cantidad_filas, semilla=semilla), tamano_lote=5000)
+                    nuevos = list(generar_productos(operaciones, desde_codigo=cantidad_filas + 1, semilla=semilla + 1))
+                    existentes = [aleatorio.randint(1, cantidad_filas) for _ in range(operaciones)]
+
+                    medidas = [
+                        {'operacion': 'carga_inicial', 'clientes': 1, 'operaciones': carga['insertados'], 'segundos': carga['segundos'],
+                         'operaciones_por_segundo': carga['filas_por_segundo']},
+                        medir_operacion('crear_producto', gestion.crear_producto,
+                                        [(ProductoElectronico(**fila) if 'categoria' in fila else ProductoAlimenticio(**fila),) for fila in nuevos],
+                                        cantidad_clientes),
+                        medir_operacion('leer_producto', gestion.leer_producto, [(codigo,) for codigo in existentes], cantidad_clientes),
+                        medir_operacion('actualizar_producto', gestion.actualizar_producto,
+                                        [(codigo, 10.0, 20.0, aleatorio.randint(0, 500)) for codigo in existentes], cantidad_clientes),
+                        medir_operacion('eliminar_producto', gestion.eliminar_producto, [(fila['codigo'],) for fila in nuevos], cantidad_clientes),
+                        medir_operacion('leer_todos_los_productos', gestion.leer_todos_los_productos, [()] * lecturas_completas, 1),
+                        medir_operacion('eliminar_registros', gestion.eliminar_registros, [()], 1),
+                    ]
+
+                for medida in medidas:
+                    medida['filas'] = cantidad_filas
+                    linea = f'{cantidad_filas:>9} filas {medida["clientes"]:>3} clientes {medida["operacion"]:<26} {medida["operaciones_por_segundo"]:>10.0f} ops/s'
+                    if 'latencia_ms' in medida:
+                        linea += f'  p50 {medida["latencia_ms"]["p50"]:>8.3f} ms  p99 {medida["latencia_ms"]["p99"]:>8.3f} ms'
+                    print(linea)
+                resultados.extend(medidas)
+
+    if salida:
+        try:
+            version = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                     cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except OSError:
+            version = ''
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            json.dump({
+                'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+                'version': version,
+                'motor': motor,
+                'python': platform.python_version(),
+                'resultados': resultados,
+            }, archivo, indent=2, ensure_ascii=False)
+        print(f'Resultados guardados en {salida}')
+
+def benchmark_exportar(filas=(100_000,), procesos=None, motor='sqlite', semilla=0):
+    '''
+    Exporta el mismo catálogo con 1, 2, 4, ... procesos hasta la cantidad de núcleos
+    y verifica que todos los archivos salgan idénticos
+    '''
+    print(f'=== Exportación en paralelo ({motor}) ===')
+    nucleos = os.cpu_count() or 1
+    procesos = procesos or sorted({*(2 ** i for i in range(nucleos.bit_length()) if 2 ** i <= nucleos), nucleos})
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for cantidad_filas in filas:
+            with contextlib.redirect_stdout(io.StringIO()):
+                gestion = nueva_gestion(motor, os.path.join(directorio, f'{cantidad_filas}.db'))
+                gestion.crear_productos_bulk(generar_productos(cantidad_filas, semilla=semilla), tamano_lote=5000)
+            fabrica = functools.partial(GestionProductos, gestion.backend)
+
+            for formato in ('csv', 'jsonl'):
+                base = None
+                huella_base = None
+                for cantidad_procesos in procesos:
+                    ruta = os.path.join(directorio, f'exportacion.{formato}')
+                    resultado = exportar_paralelo(ruta, formato, cantidad_procesos, fabrica=fabrica)
+                    with open(ruta, 'rb') as archivo:
+                        huella = hashlib.sha256(archivo.read()).hexdigest()
+                    base = base or resultado['segundos']
+                    huella_base = huella_base or huella
+                    print(f'{cantidad_filas:>9} filas {formato:<5} {cantidad_procesos:>3} procesos {resultado["segundos"]:>7.2f} s '
+                          f'{resultado["productos_por_segundo"]:>10.0f} productos/s  x{base / resultado["segundos"]:.2f}'
+                          f'{"" if huella == huella_base else "  EL ARCHIVO NO COINCIDE"}')
+
+BENCHMARKS = {
+    'leer_todos': lambda args: benchmark_leer_todos(GestionProductos()),
+    'objetos': lambda args: benchmark_objetos(),
+    'stock': lambda args: benchmark_stock(GestionProductos()),
+    'stock_diferido': lambda args: benchmark_stock(GestionProductos(), diferido=True),
+    'async': lambda args: benchmark_async(GestionProductos()),
+    'exportar': lambda args: benchmark_exportar(args.filas, args.procesos, args.motor, args.semilla),
+    'crud': lambda args: benchmark_crud(args.filas, args.clientes, args.operaciones, args.lecturas_completas, args.motor, args.salida, args.semilla),
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks del sistema de inventario')
+    parser.add_argument('benchmarks', nargs='*', choices=list(BENCHMARKS), help='Benchmarks a correr (sin nombres corre todos)')
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10_000], help='crud y exportar: tamaños de catálogo (1000 a 1000000)')
+    parser.add_argument('--clientes', type=int, nargs='+', default=[1, 4], help='crud: cantidades de clientes concurrentes')
+    parser.add_argument('--operaciones', type=int, default=2000, help='crud: llamadas por operación')
+    parser.add_argument('--lecturas-completas', type=int, default=3, help='crud: repeticiones de leer_todos_los_productos')
+    parser.add_argument('--motor', choices=['sqlite', 'mysql'], default='sqlite', help='crud y exportar: sqlite temporal o la base MySQL del .env (se borran sus productos)')
+    parser.add_argument('--semilla', type=int, default=0, help='crud y exportar: semilla de los datos sintéticos')
+    parser.add_argument('--salida', help='crud: archivo JSON para guardar los resultados')
+    parser.add_argument('--procesos', type=int, nargs='+', help='exportar: cantidades de procesos (por defecto 1, 2, 4, ... hasta los núcleos)')
+    args = parser.parse_args()
+
+    for nombre in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[nombre](args)
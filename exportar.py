@@ -0,0 +1,147 @@
+'''
+Exportación del catálogo completo a CSV o JSONL en paralelo
+
+Uso:
+    python exportar.py productos.csv
+    python exportar.py productos.jsonl --procesos 8 --particiones 32
+
+El catálogo se divide en rangos de códigos con la misma cantidad de productos.
+Cada rango se lee, se arma en objetos Producto y se serializa en un proceso aparte con su propia conexión,
+y los resultados se escriben en el archivo en orden de código a medida que llegan.
+El archivo tiene las mismas columnas que lee importar.py.
+Cada rango se lee en un momento distinto: si el catálogo cambia durante la exportación,
+el archivo puede mezclar datos de antes y de después del cambio
+'''
+# Librerías necesarias
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from inventory import ProductoElectronico, ProductoAlimenticio, GestionProductos
+
+COLUMNAS = ('codigo', 'nombre', 'costo', 'precio', 'cantidad', 'tipo', 'categoria', 'vencimiento')
+
+def fila_exportacion(producto):
+    vencimiento = getattr(producto, 'vencimiento', None)
+    return {
+        'codigo': producto.codigo,
+        'nombre': producto.nombre,
+        'costo': producto.costo,
+        'precio': producto.precio,
+        'cantidad': producto.cantidad,
+        'tipo': 'electronico' if isinstance(producto, ProductoElectronico) else 'alimenticio' if isinstance(producto, ProductoAlimenticio) else '',
+        'categoria': getattr(producto, 'categoria', None),
+        'vencimiento': vencimiento.isoformat() if vencimiento is not None else None,
+    }
+
+def escritor_csv(salida):
+    escritor = csv.writer(salida)
+    return lambda producto: escritor.writerow(['' if valor is None else valor for valor in fila_exportacion(producto).values()])
+
+def escritor_jsonl(salida):
+    return lambda producto: salida.write(json.dumps(fila_exportacion(producto), ensure_ascii=False) + '\n')
+
+ESCRITORES = {
+    'csv': escritor_csv,
+    'jsonl': escritor_jsonl,
+}
+
+def formato_de(ruta):
+    return 'jsonl' if ruta.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+def exportar_rango(gestion, rango, formato, tamano_pagina):
+    '''
+    Lee los productos del rango [desde, hasta) y los devuelve serializados: (cantidad, texto)
+    '''
+    desde, hasta = rango
+    salida = io.StringIO()
+    escribir = ESCRITORES[formato](salida)
+    cantidad = 0
+    for pagina in gestion.iterar_paginas(tamano_pagina, desde, incluir_desde=True, hasta_codigo=hasta):
+        for producto in pagina:
+            escribir(producto)
+        cantidad += len(pagina)
+    return cantidad, salida.getvalue()
+
+## Procesos de trabajo
+_gestion = None
+
+def _iniciar_trabajador(fabrica):
+    global _gestion
+    _gestion = fabrica(usar_stock_diferido=False)
+
+def _exportar_rango_trabajador(rango, formato, tamano_pagina):
+    return exportar_rango(_gestion, rango, formato, tamano_pagina)
+
+def exportar_paralelo(ruta, formato=None, procesos=None, particiones=None, tamano_pagina=5000, fabrica=GestionProductos):
+    '''
+    Exporta todo el catálogo a ruta (CSV o JSONL según la extensión si no se indica formato).
+    procesos: procesos de trabajo (por defecto uno por núcleo; con 1 se exporta en este mismo proceso).
+    particiones: rangos de códigos en que se divide el catálogo (por defecto 4 por proceso, para repartir mejor la carga).
+    fabrica: función que arma la GestionProductos de cada proceso y recibe usar_stock_diferido=False
+    (la exportación sólo lee: ningún proceso toma el journal del stock). Tiene que poder enviarse a otro proceso,
+    por ejemplo functools.partial(GestionProductos, BackendSQLite(ruta)).
+    Devuelve un dict con productos, particiones, procesos, segundos y productos_por_segundo, o None si hubo un error
+    '''
+    formato = formato or formato_de(ruta)
+    procesos = procesos or os.cpu_count() or 1
+    inicio = time.perf_counter()
+
+    gestion = fabrica(usar_stock_diferido=False)
+    rangos = gestion.particionar_codigos(particiones or procesos * 4)
+    if rangos is None:
+        return None
+
+    total = 0
+    temporal = f'{ruta}.tmp' ### Se renombra al final: nunca queda a la vista un archivo a medio exportar
+    try:
+        with open(temporal, 'w', newline='', encoding='utf-8') as archivo:
+            if formato == 'csv':
+                csv.writer(archivo).writerow(COLUMNAS)
+
+            if procesos == 1:
+                for cantidad, texto in (exportar_rango(gestion, rango, formato, tamano_pagina) for rango in rangos):
+                    archivo.write(texto)
+                    total += cantidad
+            else:
+                ### spawn: cada proceso arranca limpio (sin conexiones ni hilos heredados) y abre sus propias conexiones
+                with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_iniciar_trabajador, initargs=(fabrica,)) as executor:
+                    ### map devuelve los resultados en el orden de los rangos, a medida que van terminando
+                    ### (si un rango falla en su proceso, la excepción se lanza acá al llegar a ese resultado)
+                    for cantidad, texto in executor.map(_exportar_rango_trabajador, rangos, repeat(formato), repeat(tamano_pagina)):
+                        archivo.write(texto)
+                        total += cantidad
+    except Exception as e: ### Un rango que no se pudo leer dejaría el archivo incompleto: no se publica
+        print(f'Error al exportar los productos: {e}')
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return None
+    os.replace(temporal, ruta)
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'productos': total,
+        'particiones': len(rangos),
+        'procesos': procesos,
+        'segundos': segundos,
+        'productos_por_segundo': total / segundos if segundos else 0.0,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exportar todos los productos a un archivo CSV o JSONL')
+    parser.add_argument('archivo', help='Ruta del archivo .csv o .jsonl')
+    parser.add_argument('--procesos', type=int, default=None, help='Procesos de trabajo (por defecto uno por núcleo)')
+    parser.add_argument('--particiones', type=int, default=None, help='Rangos de códigos (por defecto 4 por proceso)')
+    args = parser.parse_args()
+
+    resultado = exportar_paralelo(args.archivo, procesos=args.procesos, particiones=args.particiones)
+    if resultado:
+        print(f'{resultado["productos"]} productos exportados en {resultado["segundos"]:.2f} s '
+              f'({resultado["productos_por_segundo"]:.0f} productos/s, {resultado["procesos"]} procesos, {resultado["particiones"]} particiones)')
@@ -0,0 +1,51 @@
+'''
+Importación masiva de productos desde CSV o JSONL
+
+Uso:
+    python importar.py productos.csv
+    python importar.py productos.jsonl --lote 5000
+
+Columnas / claves: codigo, nombre, costo, precio, cantidad y categoria (electrónicos)
+o vencimiento (alimenticios). Opcionalmente tipo: electronico | alimenticio
+'''
+# Librerías necesarias
+import argparse
+import csv
+import json
+
+from inventory import GestionProductos
+
+def leer_filas_csv(ruta):
+    '''
+    Devuelve las filas del CSV de a una, sin cargar el archivo completo en memoria
+    '''
+    with open(ruta, newline='', encoding='utf-8') as archivo:
+        yield from csv.DictReader(archivo)
+
+def leer_filas_jsonl(ruta):
+    '''
+    Devuelve los objetos del JSONL de a uno (un objeto JSON por línea)
+    '''
+    with open(ruta, encoding='utf-8') as archivo:
+        for linea in archivo:
+            if linea.strip():
+                yield json.loads(linea)
+
+def leer_filas(ruta):
+    if ruta.lower().endswith(('.jsonl', '.ndjson')):
+        return leer_filas_jsonl(ruta)
+    return leer_filas_csv(ruta)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importar productos desde un archivo CSV o JSONL')
+    parser.add_argument('archivo', help='Ruta del archivo .csv o .jsonl')
+    parser.add_argument('--lote', type=int, default=1000, help='Filas por transacción (por defecto 1000)')
+    args = parser.parse_args()
+
+    gestion_productos = GestionProductos()
+    resultado = gestion_productos.crear_productos_bulk(leer_filas(args.archivo), tamano_lote=args.lote)
+
+    for numero, codigo, mensaje in resultado['errores']:
+        print(f'Fila {numero} (codigo {codigo}): {mensaje}')
+    print(f'{resultado["insertados"]} de {resultado["filas"]} productos importados '
+          f'en {resultado["segundos"]:.2f} s ({resultado["filas_por_segundo"]:.0f} filas/s)')
@@ -0,0 +1,249 @@
+'''
+Instrumentación de GestionProductos
+
+Cuando está activa registra, por cada llamada a un método de GestionProductos:
+tiempo para obtener la conexión, sentencias SQL ejecutadas, filas leídas, tiempo en la BBDD,
+tiempo de armado de objetos (el resto) y latencia total.
+Agrupa los tiempos en histogramas por operación, deja en el log las operaciones lentas
+y envía cada registro a los sinks agregados (por ejemplo, un cliente de métricas externo).
+Desactivada (GestionProductos.instrumentacion = None) sólo cuesta una comparación por llamada
+'''
+# Librerías necesarias
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('inventario.lento')
+
+# Límites (en ms) de los intervalos de los histogramas de latencia
+LIMITES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def instrumentado(metodo):
+    '''
+    Decorador para los métodos de GestionProductos que se quieren medir
+    '''
+    nombre = metodo.__name__
+
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        instrumentacion = self.instrumentacion
+        if instrumentacion is None:
+            return metodo(self, *args, **kwargs)
+        return instrumentacion.medir(nombre, metodo, self, args, kwargs)
+
+    return envoltura
+
+class CursorInstrumentado():
+    '''
+    Envuelve un cursor para contar sentencias y filas y medir el tiempo dentro de la BBDD
+    '''
+    def __init__(self, cursor, registro) -> None:
+        self._cursor = cursor
+        self._registro = registro
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self._cursor.__exit__(*args)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def _medir(self, funcion, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args)
+        finally:
+            self._registro['sql_ms'] += (time.perf_counter() - inicio) * 1000
+
+    def execute(self, *args, **kwargs):
+        self._registro['sentencias'] += 1
+        return self._medir(lambda: self._cursor.execute(*args, **kwargs))
+
+    def executemany(self, *args, **kwargs):
+        self._registro['sentencias'] += 1
+        return self._medir(lambda: self._cursor.executemany(*args, **kwargs))
+
+    def fetchone(self):
+        fila = self._medir(self._cursor.fetchone)
+        if fila is not None:
+            self._registro['filas'] += 1
+        return fila
+
+    def fetchall(self):
+        filas = self._medir(self._cursor.fetchall)
+        self._registro['filas'] += len(filas)
+        return filas
+
+    def fetchmany(self, *args):
+        filas = self._medir(self._cursor.fetchmany, *args)
+        self._registro['filas'] += len(filas)
+        return filas
+
+    def __iter__(self):
+        while True:
+            fila = self.fetchone()
+            if fila is None:
+                return
+            yield fila
+
+class ConexionInstrumentada():
+    def __init__(self, connection, registro) -> None:
+        self._connection = connection
+        self._registro = registro
+
+    def __getattr__(self, nombre):
+        return getattr(self._connection, nombre)
+
+    def cursor(self, *args, **kwargs):
+        return CursorInstrumentado(self._connection.cursor(*args, **kwargs), self._registro)
+
+    def commit(self):
+        self._registro['sentencias'] += 1
+        inicio = time.perf_counter()
+        try:
+            return self._connection.commit()
+        finally:
+            self._registro['sql_ms'] += (time.perf_counter() - inicio) * 1000
+
+class Histograma():
+    def __init__(self) -> None:
+        self.conteos = [0] * (len(LIMITES_MS) + 1) ### El último intervalo es "más de LIMITES_MS[-1]"
+        self.cantidad = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def agregar(self, valor_ms):
+        self.conteos[bisect.bisect_left(LIMITES_MS, valor_ms)] += 1
+        self.cantidad += 1
+        self.suma += valor_ms
+        self.maximo = max(self.maximo, valor_ms)
+
+    def percentil(self, p):
+        '''
+        Percentil aproximado: límite superior del intervalo donde cae
+        '''
+        objetivo = p / 100 * self.cantidad
+        acumulado = 0
+        for limite, conteo in zip(LIMITES_MS + (self.maximo,), self.conteos):
+            acumulado += conteo
+            if acumulado >= objetivo and conteo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+    def resumen(self):
+        return {
+            'cantidad': self.cantidad,
+            'promedio_ms': self.suma / self.cantidad if self.cantidad else 0.0,
+            'p50_ms': self.percentil(50),
+            'p90_ms': self.percentil(90),
+            'p99_ms': self.percentil(99),
+            'maximo_ms': self.maximo,
+            'intervalos': {f'<={limite}': conteo for limite, conteo in zip(LIMITES_MS, self.conteos)} | {f'>{LIMITES_MS[-1]}': self.conteos[-1]},
+        }
+
+class Instrumentacion():
+    def __init__(self, umbral_lento_ms=None) -> None:
+        self.umbral_lento_ms = umbral_lento_ms
+        self.sinks = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._operaciones = {}
+
+    def agregar_sink(self, sink):
+        '''
+        sink(registro) se llama al terminar cada operación con un dict:
+        operacion, total_ms, conexion_ms, sql_ms, objetos_ms, sentencias, filas, error
+        '''
+        self.sinks.append(sink)
+
+    def medir(self, nombre, metodo, gestion, args, kwargs):
+        if getattr(self._local, 'registro', None) is not None: ### Llamada anidada: la cuenta la operación de afuera
+            return metodo(gestion, *args, **kwargs)
+
+        registro = {'operacion': nombre, 'conexion_ms': 0.0, 'sql_ms': 0.0, 'sentencias': 0, 'filas': 0, 'error': None}
+        self._local.registro = registro
+        inicio = time.perf_counter()
+        try:
+            return metodo(gestion, *args, **kwargs)
+        except Exception as e:
+            registro['error'] = repr(e)
+            raise
+        finally:
+            registro['total_ms'] = (time.perf_counter() - inicio) * 1000
+            registro['objetos_ms'] = max(0.0, registro['total_ms'] - registro['conexion_ms'] - registro['sql_ms'])
+            self._local.registro = None
+            self._registrar(registro)
+
+    def conectar(self, connect):
+        '''
+        Obtiene una conexión con connect() midiendo el tiempo y la envuelve para contar sentencias y filas
+        '''
+        registro = getattr(self._local, 'registro', None)
+        if registro is None:
+            return connect()
+        inicio = time.perf_counter()
+        connection = connect()
+        registro['conexion_ms'] += (time.perf_counter() - inicio) * 1000
+        return ConexionInstrumentada(connection, registro) if connection else connection
+
+    def _registrar(self, registro):
+        with self._lock:
+            operacion = self._operaciones.get(registro['operacion'])
+            if operacion is None:
+                operacion = self._operaciones[registro['operacion']] = {
+                    'total': Histograma(), 'conexion': Histograma(), 'sql': Histograma(), 'objetos': Histograma(),
+                    'sentencias': 0, 'filas': 0, 'errores': 0, 'lentas': 0,
+                }
+            operacion['total'].agregar(registro['total_ms'])
+            operacion['conexion'].agregar(registro['conexion_ms'])
+            operacion['sql'].agregar(registro['sql_ms'])
+            operacion['objetos'].agregar(registro['objetos_ms'])
+            operacion['sentencias'] += registro['sentencias']
+            operacion['filas'] += registro['filas']
+            operacion['errores'] += registro['error'] is not None
+            lenta = self.umbral_lento_ms is not None and registro['total_ms'] >= self.umbral_lento_ms
+            operacion['lentas'] += lenta
+
+        if lenta:
+            logger.warning('Operación lenta %s: %.1f ms (conexión %.1f ms, SQL %.1f ms en %d sentencias, %d filas, objetos %.1f ms)',
+                           registro['operacion'], registro['total_ms'], registro['conexion_ms'], registro['sql_ms'],
+                           registro['sentencias'], registro['filas'], registro['objetos_ms'])
+        for sink in self.sinks:
+            try:
+                sink(registro)
+            except Exception as e:
+                logger.error('Error en el sink de métricas %r: %s', sink, e)
+
+    def resumen(self):
+        '''
+        Devuelve, por operación: llamadas, sentencias y filas totales y los histogramas de cada tiempo
+        '''
+        with self._lock:
+            return {
+                nombre: {
+                    'llamadas': operacion['total'].cantidad,
+                    'sentencias': operacion['sentencias'],
+                    'filas': operacion['filas'],
+                    'errores': operacion['errores'],
+                    'lentas': operacion['lentas'],
+                    'total': operacion['total'].resumen(),
+                    'conexion': operacion['conexion'].resumen(),
+                    'sql': operacion['sql'].resumen(),
+                    'objetos': operacion['objetos'].resumen(),
+                }
+                for nombre, operacion in self._operaciones.items()
+            }
+
+    def exportar_json(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump(self.resumen(), archivo, indent=2, ensure_ascii=False)
+
+    def reiniciar(self):
+        with self._lock:
+            self._operaciones.clear()
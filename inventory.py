@@ -10,12 +10,55 @@ Objetivo: Desarrollar un sistema para manejar productos en un inventario.
 5. Persistir los datos en SQL.
 '''
 # Librerías necesarias
-import mysql.connector
-from mysql.connector import Error
+import bisect
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
 from decouple import config
 
+from almacenamiento import Error, FORMATOS_FECHA, crear_backend
+from instrumentacion import Instrumentacion, instrumentado
+from stock_diferido import BufferStock, con_stock_pendiente
+
+# Consulta de productos con los datos de su tipo (un solo viaje a la BBDD en lugar de uno por producto)
+CONSULTA_PRODUCTOS = '''
+SELECT p.codigo, p.nombre, p.costo, p.precio, p.cantidad,
+       pe.codigo IS NOT NULL AS es_electronico, pe.categoria, pa.vencimiento
+FROM producto p
+LEFT JOIN productoelectronico pe ON pe.codigo = p.codigo
+LEFT JOIN productoalimenticio pa ON pa.codigo = p.codigo
+'''
+
+def parsear_fecha(valor):
+    '''
+    Convierte una fecha (date, datetime o texto AAAA-MM-DD, DD/MM/AAAA o DD-MM-AAAA) en datetime.date.
+    Lanza ValueError si no es una fecha válida
+    '''
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    texto = str(valor).strip()
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Fecha inválida: {valor!r} (use AAAA-MM-DD o DD/MM/AAAA)')
+
+def en_bloques(elementos, tamano):
+    '''
+    Parte una lista en bloques de a lo sumo tamano elementos (para no armar IN (...) gigantes)
+    '''
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
 # Clase base
 class Producto():
+    __slots__ = ('__codigo', '__nombre', '__costo', '__precio', '__cantidad') ### Sin __dict__ por instancia
+
     def __init__(self, codigo, nombre, costo, precio, cantidad) -> None:
         self.__codigo = self.validar_codigo(codigo)
         self.__nombre = self.validar_nombre(nombre)
@@ -23,6 +66,19 @@ class Producto():
         self.__precio = self.validar_precio(precio)
         self.__cantidad = self.validar_cantidad(cantidad)
 
+    @classmethod
+    def desde_bd(cls, codigo, nombre, costo, precio, cantidad):
+        '''
+        Construye el producto sin volver a validar, para datos que ya vienen de la BBDD
+        '''
+        producto = cls.__new__(cls)
+        producto.__codigo = int(codigo)
+        producto.__nombre = nombre
+        producto.__costo = costo
+        producto.__precio = precio
+        producto.__cantidad = cantidad
+        return producto
+
     ##Getters
     @property
     def codigo(self):
@@ -120,10 +176,18 @@ class Producto():
 
 # Clases derivadas
 class ProductoElectronico(Producto):
+    __slots__ = ('__categoria',)
+
     def __init__(self, codigo, nombre, costo, precio, cantidad, categoria) -> None:
         super().__init__(codigo, nombre, costo, precio, cantidad)
         self.__categoria = categoria
 
+    @classmethod
+    def desde_bd(cls, codigo, nombre, costo, precio, cantidad, categoria):
+        producto = super().desde_bd(codigo, nombre, costo, precio, cantidad)
+        producto.__categoria = categoria
+        return producto
+
     ##Getters
     @property
     def categoria(self):
@@ -133,9 +197,24 @@ class ProductoElectronico(Producto):
         return f'{super().__str__()} - categoria: {self.categoria}'
     
 class ProductoAlimenticio(Producto):
+    __slots__ = ('__vencimiento',)
+
     def __init__(self, codigo, nombre, costo, precio, cantidad, vencimiento) -> None:
         super().__init__(codigo, nombre, costo, precio, cantidad)
-        self.__vencimiento = vencimiento
+        self.__vencimiento = self.validar_vencimiento(vencimiento)
+
+    @classmethod
+    def desde_bd(cls, codigo, nombre, costo, precio, cantidad, vencimiento):
+        producto = super().desde_bd(codigo, nombre, costo, precio, cantidad)
+        ### MySQL devuelve DATE como datetime.date; SQLite lo guarda como texto, que en bases viejas puede venir como DD/MM/AAAA
+        producto.__vencimiento = parsear_fecha(vencimiento)
+        return producto
+
+    def validar_vencimiento(self, vencimiento):
+        try:
+            return parsear_fecha(vencimiento)
+        except ValueError:
+            print('El vencimiento debe ser una fecha (AAAA-MM-DD o DD/MM/AAAA)')
 
     ##Getters
     @property
@@ -145,27 +224,236 @@ class ProductoAlimenticio(Producto):
     def __str__(self) -> str:
         return f'{super().__str__()} - vencimiento: {self.vencimiento}'
 
+# Cache de productos
+class CacheProductos():
+    '''
+    Cache LRU con vencimiento (TTL) de productos por código.
+    Guarda las mismas instancias que devuelve leer_producto, por lo que no deben modificarse
+    '''
+    def __init__(self, tamano_maximo, ttl) -> None:
+        self.tamano_maximo = tamano_maximo
+        self.ttl = ttl
+        self._entradas = OrderedDict() ### codigo -> (momento de vencimiento, producto)
+        self._lock = threading.Lock()
+        ### Para no guardar lo leído antes de una invalidación (ver version y guardar)
+        self._generacion = 0
+        self._invalidados = OrderedDict() ### codigo -> generación de su última invalidación (las más recientes)
+        self._piso = 0 ### Invalidaciones olvidadas: una lectura empezada antes de esta generación no se guarda
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.vencidos = 0
+
+    @staticmethod
+    def clave(codigo):
+        return int(codigo)
+
+    def obtener(self, codigo):
+        '''
+        Devuelve el producto guardado o None si no está o ya venció
+        '''
+        clave = self.clave(codigo)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            vence, producto = entrada
+            if vence < time.monotonic():
+                del self._entradas[clave]
+                self.vencidos += 1
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return producto
+
+    def version(self):
+        '''
+        Se toma antes de leer de la BBDD y se pasa a guardar: si el código se invalidó mientras tanto,
+        lo leído puede ser anterior al cambio y no se guarda
+        '''
+        with self._lock:
+            return self._generacion
+
+    def guardar(self, producto, version=None):
+        clave = self.clave(producto.codigo)
+        with self._lock:
+            if version is not None and (version < self._piso or self._invalidados.get(clave, 0) > version):
+                return ### Se invalidó durante la lectura
+            self._entradas[clave] = (time.monotonic() + self.ttl, producto)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano_maximo:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, codigo):
+        clave = self.clave(codigo)
+        with self._lock:
+            self._entradas.pop(clave, None)
+            self._generacion += 1
+            self._invalidados[clave] = self._generacion
+            self._invalidados.move_to_end(clave)
+            if len(self._invalidados) > self.tamano_maximo:
+                _, self._piso = self._invalidados.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._generacion += 1
+            self._piso = self._generacion
+            self._invalidados.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'tamano': len(self._entradas),
+                'tamano_maximo': self.tamano_maximo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'vencidos': self.vencidos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            }
+
+# Índice de vencimientos
+class IndiceVencimientos():
+    '''
+    Productos alimenticios ordenados por fecha de vencimiento (lista ordenada + búsqueda binaria),
+    para responder al instante qué vence próximo sin recorrer el catálogo
+    '''
+    def __init__(self, productos=()) -> None:
+        ### La carga inicial se ordena de una vez: insort por producto mueve la lista en cada inserción (cuadrático)
+        self._fechas = {producto.codigo: producto.vencimiento for producto in productos
+                        if isinstance(producto, ProductoAlimenticio) and producto.vencimiento is not None} ### codigo -> vencimiento
+        self._orden = sorted((vencimiento, codigo) for codigo, vencimiento in self._fechas.items()) ### (vencimiento, codigo) ordenados
+        self._lock = threading.Lock()
+
+    def actualizar(self, producto):
+        '''
+        Agrega o reubica un producto (si no es alimenticio sólo lo quita)
+        '''
+        with self._lock:
+            self._quitar(producto.codigo)
+            if isinstance(producto, ProductoAlimenticio) and producto.vencimiento is not None:
+                self._fechas[producto.codigo] = producto.vencimiento
+                bisect.insort(self._orden, (producto.vencimiento, producto.codigo))
+
+    def quitar(self, codigo):
+        with self._lock:
+            self._quitar(int(codigo))
+
+    def _quitar(self, codigo):
+        fecha = self._fechas.pop(codigo, None)
+        if fecha is not None:
+            del self._orden[bisect.bisect_left(self._orden, (fecha, codigo))]
+
+    def proximos_a_vencer(self, dias, desde=None):
+        '''
+        [(vencimiento, codigo)] de los que vencen entre desde (hoy por defecto) y desde + dias, en orden
+        '''
+        desde = desde or datetime.date.today()
+        hasta = desde + datetime.timedelta(days=dias)
+        with self._lock:
+            inicio = bisect.bisect_left(self._orden, (desde,))
+            fin = bisect.bisect_left(self._orden, (hasta + datetime.timedelta(days=1),))
+            return self._orden[inicio:fin]
+
+    def siguientes(self, cantidad=1, desde=None):
+        '''
+        Los próximos cantidad productos en vencer a partir de desde (hoy por defecto)
+        '''
+        desde = desde or datetime.date.today()
+        with self._lock:
+            inicio = bisect.bisect_left(self._orden, (desde,))
+            return self._orden[inicio:inicio + cantidad]
+
+    def __len__(self):
+        return len(self._orden)
+
 # Clase de gestion
 class GestionProductos():
-    def __init__(self) -> None:
-        self.host = config('DB_HOST')
-        self.name = config('DB_NAME')
-        self.user = config('DB_USER')
-        self.password = config('DB_PASS')
-        self.port = config('DB_PORT')
+    def __init__(self, backend=None, instrumentacion=None, usar_stock_diferido=True) -> None:
+        ### Motor de almacenamiento (MySQL o SQLite) elegido con DB_BACKEND si no se pasa uno
+        self.backend = backend or crear_backend()
+
+        ### Instrumentación opcional (tiempos, sentencias y filas por operación)
+        if instrumentacion is None and config('INSTRUMENTACION', default=False, cast=bool):
+            instrumentacion = Instrumentacion(config('INSTRUMENTACION_UMBRAL_LENTO_MS', default=None, cast=lambda valor: None if valor in (None, '') else float(valor)))
+        self.instrumentacion = instrumentacion
+
+        ### Cache opcional para leer_producto (CACHE_SIZE = 0 la desactiva)
+        cache_size = config('CACHE_SIZE', default=0, cast=int)
+        self.cache = CacheProductos(cache_size, config('CACHE_TTL', default=60, cast=float)) if cache_size > 0 else None
+
+        ### Escritura diferida opcional del stock (STOCK_DIFERIDO_MS = 0 la desactiva). usar_stock_diferido=False la desactiva
+        ### siempre, para procesos que no deben tomar el directorio del journal ni aplicar lo que quedó en él (exportar.py)
+        self.stock_diferido = None
+        intervalo_ms = config('STOCK_DIFERIDO_MS', default=0, cast=float)
+        if usar_stock_diferido and intervalo_ms > 0:
+            self.activar_stock_diferido(intervalo_ms, config('STOCK_DIFERIDO_CAMBIOS', default=500, cast=int),
+                                        config('STOCK_DIFERIDO_DIRECTORIO', default='stock_diferido'))
+
+    def estadisticas_pool(self):
+        return self.backend.estadisticas()
+
+    def estadisticas_cache(self):
+        return self.cache.estadisticas() if self.cache else None
+
+    def _invalidar_cache(self, codigo):
+        if self.cache:
+            self.cache.invalidar(codigo)
+
+    def activar_stock_diferido(self, intervalo_ms=100, max_cambios=500, directorio='stock_diferido'):
+        '''
+        Desde ahora ajustar_stock y ajustar_stock_lote anotan los ajustes en un journal local y los guardan
+        agrupados cada intervalo_ms o cada max_cambios ajustes (ver stock_diferido.py).
+        Si en el directorio quedaron ajustes sin guardar de una ejecución anterior, se guardan primero.
+        Si otro proceso ya usa el directorio, sigue sin escritura diferida y devuelve None
+        '''
+        if self.stock_diferido is None:
+            try:
+                self.stock_diferido = BufferStock(self, intervalo_ms, max_cambios, directorio)
+            except RuntimeError as e:
+                print(f'No se activó la escritura diferida del stock: {e}')
+        return self.stock_diferido
+
+    def estadisticas_stock_diferido(self):
+        return self.stock_diferido.estadisticas() if self.stock_diferido else None
+
+    def _vaciar_stock_diferido(self):
+        '''
+        Guarda los ajustes de stock pendientes antes de una operación que fija la cantidad o borra productos,
+        para que no se sumen después sobre el valor nuevo.
+        Devuelve False si no se pudieron guardar: la operación no debe seguir
+        '''
+        if self.stock_diferido and not self.stock_diferido.vaciar():
+            print('No se pudieron guardar los ajustes de stock pendientes: se cancela la operación')
+            return False
+        return True
+
+    def _registrar_cambios(self, cursor, codigos):
+        '''
+        Anota en productocambio los códigos creados, modificados o eliminados (en la misma transacción que el cambio)
+        para que las réplicas los lean con cambios_desde. Va justo antes del commit: el bloqueo de productocambioorden
+        dura hasta el commit, así ninguna otra transacción anota cambios en el medio y los id quedan en el orden de los commits
+        '''
+        codigos = [(str(codigo),) for codigo in dict.fromkeys(codigos)]
+        if codigos:
+            cursor.execute('SELECT id FROM productocambioorden WHERE id = 1 FOR UPDATE')
+            cursor.fetchone()
+            cursor.executemany('INSERT INTO productocambio (codigo) VALUES (%s)', codigos)
 
     def connect(self):
         '''
-        Establece la conexión con la BBDD
+        Obtiene una conexión del motor de almacenamiento. Al cerrarla (connection.close()) vuelve al pool
         '''
         try:
-            connection = mysql.connector.connect(
-                host = self.host,
-                database = self.name,
-                user = self.user,
-                password = self.password,
-                port = self.port
-            )
+            if self.instrumentacion is None:
+                connection = self.backend.connect()
+            else:
+                connection = self.instrumentacion.conectar(self.backend.connect)
 
             if connection.is_connected:
                 return connection
@@ -173,6 +461,19 @@ class GestionProductos():
             print(f'Error al conectarse a la base de datos: {e}')
             return None
 
+    @staticmethod
+    def _cerrar(connection):
+        '''
+        Devuelve la conexión al pool siempre, aunque el servidor la haya cortado (is_connected() en False):
+        si no se devuelve, el pool pierde ese lugar para siempre. El pool la reconecta al volver a entregarla
+        '''
+        if connection:
+            try:
+                connection.close()
+            except Error:
+                pass ### Falló el reset de la sesión de una conexión cortada: igual volvió al pool
+
+    @instrumentado
     def crear_producto(self, producto):
         '''
         Este método va a recibir una instancia de Producto cuando llamemos desde main.py. Es decir, recibirá un input del usuario
@@ -216,15 +517,172 @@ class GestionProductos():
                         cursor.execute(query, (producto.codigo, producto.vencimiento))
                     
                     ### Guardar cambios
+                    self._registrar_cambios(cursor, [producto.codigo])
                     connection.commit()
+                    self._invalidar_cache(producto.codigo)
                     print(f'Producto {producto.nombre} creado exitosamente')
         except Exception as e:
             print(f'Error inesperado al crear producto: {e}')
     
+    def _valores_fila(self, fila):
+        '''
+        Valida una fila de importación (dict o instancia de Producto) y devuelve
+        (valores de producto, tabla del tipo, valor del tipo). Lanza ValueError si algo no es válido
+        '''
+        if isinstance(fila, Producto):
+            fila = {
+                'codigo': fila.codigo, 'nombre': fila.nombre, 'costo': fila.costo,
+                'precio': fila.precio, 'cantidad': fila.cantidad,
+                'categoria': getattr(fila, 'categoria', None),
+                'vencimiento': getattr(fila, 'vencimiento', None),
+                'tipo': 'electronico' if isinstance(fila, ProductoElectronico) else 'alimenticio' if isinstance(fila, ProductoAlimenticio) else '',
+            }
+
+        try:
+            codigo = int(fila['codigo'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('El código debe ser un número entero')
+        nombre = str(fila.get('nombre') or '').strip()
+        if nombre == '':
+            raise ValueError('El nombre no puede estar vacío')
+        try:
+            costo = float(fila['costo'])
+            precio = float(fila['precio'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('El costo y el precio deben ser numéricos')
+        if costo <= 0 or precio <= 0:
+            raise ValueError('El costo y el precio no pueden ser negativos o cero')
+        try:
+            cantidad = int(fila['cantidad'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('La cantidad debe ser un número entero')
+        if cantidad < 0:
+            raise ValueError('La cantidad no puede ser menor a 0')
+
+        tipo = str(fila.get('tipo') or '').lower()
+        categoria = fila.get('categoria') or None
+        vencimiento = fila.get('vencimiento') or None
+        if tipo == 'electronico' or (tipo == '' and categoria is not None):
+            return (codigo, nombre, costo, precio, cantidad), 'productoelectronico', categoria
+        elif tipo == 'alimenticio' or (tipo == '' and vencimiento is not None):
+            if vencimiento is None:
+                raise ValueError('El producto alimenticio debe tener vencimiento')
+            return (codigo, nombre, costo, precio, cantidad), 'productoalimenticio', parsear_fecha(vencimiento)
+        raise ValueError('No se pudo determinar el tipo de producto (electronico o alimenticio)')
+
+    def _insertar_lote(self, lote, errores):
+        '''
+        Inserta un lote de filas ya validadas en una sola transacción.
+        Devuelve la cantidad de productos insertados
+        '''
+        connection = self.connect()
+        if not connection:
+            errores.extend((numero, valores[0], 'Sin conexión a la base de datos') for numero, valores, _, _ in lote)
+            return 0
+
+        try:
+            with connection.cursor() as cursor:
+                ### Verificamos en conjunto qué códigos ya existen
+                codigos = [valores[0] for _, valores, _, _ in lote]
+                marcadores = ', '.join(['%s'] * len(codigos))
+                ### Como texto: codigo es char y comparado con números MySQL no puede usar la clave primaria (recorre toda la tabla)
+                cursor.execute(f'SELECT codigo FROM producto WHERE codigo IN ({marcadores})', [str(codigo) for codigo in codigos])
+                existentes = {int(codigo) for (codigo,) in cursor.fetchall()}
+
+                productos, electronicos, alimenticios = [], [], []
+                for numero, valores, tabla, valor_tipo in lote:
+                    if valores[0] in existentes:
+                        errores.append((numero, valores[0], 'Ya existe un producto con ese código'))
+                        continue
+                    productos.append(valores)
+                    if tabla == 'productoelectronico':
+                        electronicos.append((valores[0], valor_tipo))
+                    else:
+                        alimenticios.append((valores[0], valor_tipo))
+
+                ### executemany arma un único INSERT de varias filas por tabla
+                if productos:
+                    cursor.executemany('INSERT INTO producto (codigo, nombre, costo, precio, cantidad) VALUES (%s, %s, %s, %s, %s)', productos)
+                if electronicos:
+                    cursor.executemany('INSERT INTO productoelectronico (codigo, categoria) VALUES (%s, %s)', electronicos)
+                if alimenticios:
+                    cursor.executemany('INSERT INTO productoalimenticio (codigo, vencimiento) VALUES (%s, %s)', alimenticios)
+                self._registrar_cambios(cursor, [valores[0] for valores in productos])
+
+                connection.commit()
+                return len(productos)
+        except Error as e:
+            connection.rollback()
+            errores.extend((numero, valores[0], f'Error al insertar el lote: {e}') for numero, valores, _, _ in lote)
+            return 0
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
+    def crear_productos_bulk(self, filas, tamano_lote=1000):
+        '''
+        Inserta muchos productos por lotes: cada lote se verifica e inserta en una sola transacción.
+        filas puede ser cualquier iterable (se recorre de a una fila) de dicts con las columnas
+        codigo, nombre, costo, precio, cantidad y categoria o vencimiento (opcionalmente tipo),
+        o de instancias de ProductoElectronico/ProductoAlimenticio.
+        Devuelve un dict con insertados, errores [(numero de fila, codigo, mensaje)], segundos y filas_por_segundo
+        '''
+        inicio = time.perf_counter()
+        insertados = 0
+        errores = []
+        vistos = set()
+        lote = []
+        total = 0
+
+        for numero, fila in enumerate(filas, start=1):
+            total = numero
+            try:
+                valores, tabla, valor_tipo = self._valores_fila(fila)
+            except ValueError as e:
+                codigo = fila.get('codigo') if isinstance(fila, dict) else getattr(fila, 'codigo', None)
+                errores.append((numero, codigo, str(e)))
+                continue
+
+            if valores[0] in vistos:
+                errores.append((numero, valores[0], 'Código repetido en la importación'))
+                continue
+            vistos.add(valores[0])
+
+            lote.append((numero, valores, tabla, valor_tipo))
+            if len(lote) >= tamano_lote:
+                insertados += self._insertar_lote(lote, errores)
+                lote = []
+
+        if lote:
+            insertados += self._insertar_lote(lote, errores)
+
+        segundos = time.perf_counter() - inicio
+        return {
+            'filas': total,
+            'insertados': insertados,
+            'errores': errores,
+            'segundos': segundos,
+            'filas_por_segundo': total / segundos if segundos else 0.0,
+        }
+
+    @instrumentado
     def leer_producto(self, codigo):
         '''
-        Buscar producto por código
+        Buscar producto por código (primero en la cache, si está activa).
+        Con la escritura diferida del stock activa, la cantidad incluye los ajustes todavía no guardados
         '''
+        if self.stock_diferido:
+            producto, pendientes = self.stock_diferido.consultar(lambda: self._leer_producto(codigo))
+            return con_stock_pendiente(producto, pendientes)
+        return self._leer_producto(codigo)
+
+    def _leer_producto(self, codigo):
+        if self.cache:
+            producto = self.cache.obtener(codigo)
+            if producto is not None:
+                return producto
+            version = self.cache.version()
+
         try:
             connection = self.connect()
             if connection:
@@ -238,36 +696,88 @@ class GestionProductos():
 
                         if categoria: ### Si es un producto de tipo electronico
                             datos_producto['categoria'] = categoria['categoria'] ### Asigna el valor de categoria obtenido en fetch a una nueva key (categoria) en el dicc de datos_productos
-                            producto = ProductoElectronico(**datos_producto)
+                            producto = ProductoElectronico.desde_bd(**datos_producto)
                         else: ### No es de tipo electronico si no alimenticio (no tiene categoría)
                             cursor.execute('SELECT vencimiento FROM productoalimenticio WHERE codigo = %s', (codigo,))
                             vencimiento = cursor.fetchone()
                             if vencimiento:
                                 datos_producto['vencimiento'] = vencimiento['vencimiento']
-                                producto = ProductoAlimenticio(**datos_producto)
+                                producto = ProductoAlimenticio.desde_bd(**datos_producto)
                             else: ### Caso (hipotetico) donde no es electronico ni alimenticio
-                                producto = Producto(**datos_producto)
+                                producto = Producto.desde_bd(**datos_producto)
                     else:
                         producto = None
         except Error as e:
             print(f'Error al leer producto: {e}')
         else:
+            if self.cache and producto is not None:
+                self.cache.guardar(producto, version)
             return producto
         finally:
-            if connection.is_connected():
-                connection.close()
+            self._cerrar(connection)
+
+    @instrumentado
+    def leer_productos(self, codigos, tamano_bloque=1000):
+        '''
+        Busca muchos productos por código con una consulta por bloque (WHERE codigo IN (...)) en lugar de una por código.
+        Devuelve {codigo: producto} con todos los códigos pedidos: los que no existen quedan con valor None.
+        Devuelve None si no se pudo leer (sin conexión o con error), para no confundir una caída con productos inexistentes
+        '''
+        if self.stock_diferido:
+            productos, pendientes = self.stock_diferido.consultar(lambda: self._leer_productos(codigos, tamano_bloque))
+            if productos is not None:
+                productos = {codigo: con_stock_pendiente(producto, pendientes) for codigo, producto in productos.items()}
+            return productos
+        return self._leer_productos(codigos, tamano_bloque)
+
+    def _leer_productos(self, codigos, tamano_bloque):
+        productos = {int(codigo): None for codigo in codigos}
+        pendientes = list(productos)
+
+        if self.cache:
+            pendientes = []
+            for codigo in productos:
+                productos[codigo] = self.cache.obtener(codigo)
+                if productos[codigo] is None:
+                    pendientes.append(codigo)
+            version = self.cache.version()
+        if not pendientes:
+            return productos
 
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor(dictionary=True) as cursor:
+                for bloque in en_bloques(pendientes, tamano_bloque):
+                    marcadores = ', '.join(['%s'] * len(bloque))
+                    cursor.execute(CONSULTA_PRODUCTOS + f'WHERE p.codigo IN ({marcadores})', [str(codigo) for codigo in bloque])
+                    for producto_data in cursor.fetchall():
+                        producto = self._construir_producto(producto_data)
+                        productos[producto.codigo] = producto
+                        if self.cache:
+                            self.cache.guardar(producto, version)
+        except Error as e:
+            print(f'Error al leer los productos: {e}')
+        else:
+            return productos
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
     def actualizar_producto(self, codigo, nuevo_costo, nuevo_precio, nueva_cantidad):
         '''
         Modificar los datos de los productos en la BBDD
         '''
+        if not self._vaciar_stock_diferido():
+            return
         try:
             connection = self.connect()
             if connection:
                 with connection.cursor() as cursor:
-                    ## Verificar si existe el código
-                    producto = self.leer_producto(codigo)
-                    if producto == None:
+                    ## Verificar si existe el código (con la misma conexión)
+                    cursor.execute('SELECT codigo FROM producto WHERE codigo = %s', (codigo,))
+                    if not cursor.fetchone():
                         print(f'Producto de código {codigo} inexistente')
                         return
                     
@@ -278,21 +788,113 @@ class GestionProductos():
                     cursor.execute(query ,(nuevo_costo, nuevo_precio, nueva_cantidad, codigo))
 
                     if cursor.rowcount > 0:
+                        self._registrar_cambios(cursor, [codigo])
                         connection.commit()
+                        self._invalidar_cache(codigo)
                         print('Los datos se guardaron correctamente')
                     else:
                         print(f'No se encontró producto de código {codigo}')
         except Error as e:
             print(f'Error al actualizar el producto: {e}')
         finally:
-            if connection.is_connected():
-                connection.close()
+            self._cerrar(connection)
+
+    @instrumentado
+    def ajustar_stock(self, codigo, delta):
+        '''
+        Suma delta (negativo para ventas) a la cantidad del producto de forma atómica:
+        bloquea la fila con SELECT ... FOR UPDATE, así dos terminales no se pisan los cambios.
+        No permite dejar el stock por debajo de 0. Devuelve la nueva cantidad o None si no se pudo ajustar
+        '''
+        if self.stock_diferido:
+            nuevas = self.stock_diferido.ajustar([(codigo, delta)])
+            return nuevas[int(codigo)] if nuevas else None
+
+        codigo = str(codigo) ### codigo es char: comparado con un número MySQL no usa la clave primaria y bloquea toda la tabla
+        try:
+            connection = self.connect()
+            if connection:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT cantidad FROM producto WHERE codigo = %s FOR UPDATE', (codigo,))
+                    fila = cursor.fetchone()
+                    if not fila:
+                        connection.rollback()
+                        print(f'Producto de código {codigo} inexistente')
+                        return None
+
+                    nueva_cantidad = fila[0] + delta
+                    if nueva_cantidad < 0:
+                        connection.rollback()
+                        print(f'Stock insuficiente para el producto {codigo}: hay {fila[0]} y se piden {-delta}')
+                        return None
+
+                    cursor.execute('UPDATE producto SET cantidad = cantidad + %s WHERE codigo = %s', (delta, codigo))
+                    self._registrar_cambios(cursor, [codigo])
+                    connection.commit()
+                    self._invalidar_cache(codigo)
+                    return nueva_cantidad
+        except Error as e:
+            print(f'Error al ajustar el stock: {e}')
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
+    def ajustar_stock_lote(self, movimientos):
+        '''
+        Aplica todos los movimientos de un ticket [(codigo, delta), ...] en una sola transacción:
+        o se aplican todos o ninguno (si falta algún producto o alguno quedaría con stock negativo).
+        Las filas se bloquean en orden de código para que dos tickets simultáneos no se traben entre sí.
+        Devuelve {codigo: nueva cantidad} o None si no se pudo aplicar
+        '''
+        if self.stock_diferido:
+            return self.stock_diferido.ajustar(movimientos)
 
+        deltas = {}
+        for codigo, delta in movimientos:
+            deltas[str(codigo)] = deltas.get(str(codigo), 0) + delta
+        if not deltas:
+            return {}
+
+        try:
+            connection = self.connect()
+            if connection:
+                with connection.cursor() as cursor:
+                    marcadores = ', '.join(['%s'] * len(deltas))
+                    cursor.execute(f'SELECT codigo, cantidad FROM producto WHERE codigo IN ({marcadores}) ORDER BY codigo FOR UPDATE', list(deltas))
+                    cantidades = {codigo: cantidad for codigo, cantidad in cursor.fetchall()}
+
+                    faltantes = [codigo for codigo in deltas if codigo not in cantidades]
+                    if faltantes:
+                        connection.rollback()
+                        print(f'Productos inexistentes: {", ".join(faltantes)}')
+                        return None
+
+                    insuficientes = [codigo for codigo, delta in deltas.items() if cantidades[codigo] + delta < 0]
+                    if insuficientes:
+                        connection.rollback()
+                        print(f'Stock insuficiente para: {", ".join(insuficientes)}')
+                        return None
+
+                    cursor.executemany('UPDATE producto SET cantidad = cantidad + %s WHERE codigo = %s',
+                                       [(delta, codigo) for codigo, delta in deltas.items()])
+                    self._registrar_cambios(cursor, deltas)
+                    connection.commit()
+                    for codigo in deltas:
+                        self._invalidar_cache(codigo)
+                    return {int(codigo): cantidades[codigo] + delta for codigo, delta in deltas.items()}
+        except Error as e:
+            print(f'Error al ajustar el stock del lote: {e}')
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
     def eliminar_producto(self, codigo):
         '''
         Busca un producto por código
         y lo elimina de la BBDD
         '''
+        if not self._vaciar_stock_diferido():
+            return
         try:
             connection = self.connect()
             if connection:
@@ -308,66 +910,546 @@ class GestionProductos():
                     cursor.execute('DELETE FROM productoalimenticio WHERE codigo = %s', (codigo,))
                     cursor.execute('DELETE FROM producto WHERE codigo = %s', (codigo,))
                     if cursor.rowcount > 0:
+                        self._registrar_cambios(cursor, [codigo])
                         connection.commit()
+                        self._invalidar_cache(codigo)
                         print(f'Producto de codigo: {codigo} eliminado correctamente')
                     else:
                         print(f'No se encontró producto con codigo: {codigo}')
         except Exception as e:
             print(f'Error al eliminar el producto: {e}')
         finally:
-            if connection.is_connected():
-                connection.close()
+            self._cerrar(connection)
+
+    @instrumentado
+    def actualizar_productos(self, cambios, tamano_bloque=1000):
+        '''
+        Actualiza muchos productos en una sola transacción.
+        cambios: iterable de (codigo, nuevo_costo, nuevo_precio, nueva_cantidad)
+        Devuelve {'actualizados': [codigos], 'inexistentes': [codigos]} o None si hubo un error (no se guarda nada)
+        '''
+        por_codigo = {int(codigo): (costo, precio, cantidad) for codigo, costo, precio, cantidad in cambios}
+        resultado = {'actualizados': [], 'inexistentes': []}
+        if not por_codigo:
+            return resultado
+
+        if not self._vaciar_stock_diferido():
+            return None
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                for bloque in en_bloques(list(por_codigo), tamano_bloque):
+                    marcadores = ', '.join(['%s'] * len(bloque))
+                    cursor.execute(f'SELECT codigo FROM producto WHERE codigo IN ({marcadores})', [str(codigo) for codigo in bloque])
+                    existentes = {int(codigo) for (codigo,) in cursor.fetchall()}
+
+                    resultado['inexistentes'].extend(codigo for codigo in bloque if codigo not in existentes)
+                    actualizar = [codigo for codigo in bloque if codigo in existentes]
+                    if actualizar:
+                        cursor.executemany('UPDATE producto SET costo = %s, precio = %s, cantidad = %s WHERE codigo = %s',
+                                           [(*por_codigo[codigo], str(codigo)) for codigo in actualizar])
+                        resultado['actualizados'].extend(actualizar)
+
+                self._registrar_cambios(cursor, resultado['actualizados'])
+                connection.commit()
+                for codigo in resultado['actualizados']:
+                    self._invalidar_cache(codigo)
+        except Error as e:
+            print(f'Error al actualizar los productos: {e}')
+            return None
+        else:
+            return resultado
+        finally:
+            self._cerrar(connection)
 
+    @instrumentado
+    def eliminar_productos(self, codigos, tamano_bloque=1000):
+        '''
+        Elimina muchos productos en una sola transacción (con DELETE ... WHERE codigo IN por bloques).
+        Devuelve {'eliminados': [codigos], 'inexistentes': [codigos]} o None si hubo un error (no se borra nada)
+        '''
+        codigos = list(dict.fromkeys(int(codigo) for codigo in codigos)) ### Sin repetidos y en el orden recibido
+        resultado = {'eliminados': [], 'inexistentes': []}
+        if not codigos:
+            return resultado
+
+        if not self._vaciar_stock_diferido():
+            return None
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                for bloque in en_bloques(codigos, tamano_bloque):
+                    marcadores = ', '.join(['%s'] * len(bloque))
+                    parametros = [str(codigo) for codigo in bloque]
+                    cursor.execute(f'SELECT codigo FROM producto WHERE codigo IN ({marcadores})', parametros)
+                    existentes = {int(codigo) for (codigo,) in cursor.fetchall()}
+
+                    resultado['inexistentes'].extend(codigo for codigo in bloque if codigo not in existentes)
+                    if existentes:
+                        cursor.execute(f'DELETE FROM productoelectronico WHERE codigo IN ({marcadores})', parametros)
+                        cursor.execute(f'DELETE FROM productoalimenticio WHERE codigo IN ({marcadores})', parametros)
+                        cursor.execute(f'DELETE FROM producto WHERE codigo IN ({marcadores})', parametros)
+                        resultado['eliminados'].extend(codigo for codigo in bloque if codigo in existentes)
+
+                self._registrar_cambios(cursor, resultado['eliminados'])
+                connection.commit()
+                for codigo in resultado['eliminados']:
+                    self._invalidar_cache(codigo)
+        except Error as e:
+            print(f'Error al eliminar los productos: {e}')
+            return None
+        else:
+            return resultado
+        finally:
+            self._cerrar(connection)
+
+    @staticmethod
+    def _construir_producto(datos):
+        '''
+        Arma la instancia que corresponde (electrónico, alimenticio o base)
+        a partir de una fila de CONSULTA_PRODUCTOS
+        '''
+        es_electronico = datos.pop('es_electronico')
+        categoria = datos.pop('categoria')
+        vencimiento = datos.pop('vencimiento')
+
+        if es_electronico:
+            return ProductoElectronico.desde_bd(**datos, categoria=categoria)
+        elif vencimiento is not None:
+            return ProductoAlimenticio.desde_bd(**datos, vencimiento=vencimiento)
+        else: ### Caso (hipotetico) donde no es electronico ni alimenticio
+            return Producto.desde_bd(**datos)
+
+    @instrumentado
     def leer_todos_los_productos(self):
+        '''
+        Trae todos los productos junto con los datos de su tipo en una sola consulta
+        '''
         try:
             connection = self.connect()
             if connection:
                 with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute('SELECT * FROM producto')
-                    productos_data = cursor.fetchall()
+                    cursor.execute(CONSULTA_PRODUCTOS)
+                    productos = [self._construir_producto(producto_data) for producto_data in cursor.fetchall()]
 
-                    productos = []
-                    
-                    for producto_data in productos_data:
-                        codigo = producto_data['codigo']
+        except Exception as e:
+            print(f'Error al mostrar todos los productos: {e}')
+        else:
+            return productos
+        finally:
+            self._cerrar(connection)
 
-                        cursor.execute('SELECT categoria FROM productoelectronico WHERE codigo = %s', (codigo,))
-                        categoria = cursor.fetchone()
+    @instrumentado
+    def leer_pagina(self, tamano_pagina=500, desde_codigo=None, incluir_desde=False, hasta_codigo=None):
+        '''
+        Lee una página del catálogo: hasta tamano_pagina productos con codigo > desde_codigo (>= con incluir_desde)
+        y < hasta_codigo, en orden de código. Instrumentada: cada página de iterar_paginas queda registrada.
+        Si no se puede leer lanza la excepción
+        '''
+        comparador = '>=' if incluir_desde else '>'
+        condicion_hasta = '' if hasta_codigo is None else 'AND p.codigo < %s '
+        parametros_hasta = () if hasta_codigo is None else (str(hasta_codigo),)
 
-                        if categoria:
-                            producto_data['categoria'] = categoria['categoria']
-                            producto = ProductoElectronico(**producto_data)
-                        else:
-                            cursor.execute('SELECT vencimiento FROM productoalimenticio WHERE codigo = %s', (codigo,))
-                            vencimiento = cursor.fetchone()
-                            producto_data['vencimiento'] = vencimiento['vencimiento']
-                            producto = ProductoAlimenticio(**producto_data)
+        connection = self.connect()
+        if not connection:
+            raise ConnectionError('No se pudo conectar a la base de datos para recorrer los productos')
+        try:
+            with connection.cursor(dictionary=True) as cursor: ### Cursor sin buffer: las filas se leen a medida que llegan
+                cursor.execute(CONSULTA_PRODUCTOS + f'WHERE p.codigo {comparador} %s {condicion_hasta}ORDER BY p.codigo LIMIT %s',
+                               ('' if desde_codigo is None else str(desde_codigo), *parametros_hasta, tamano_pagina))
+                return [self._construir_producto(producto_data) for producto_data in cursor]
+        except Error as e:
+            print(f'Error al recorrer los productos: {e}')
+            raise
+        finally:
+            self._cerrar(connection)
 
-                        productos.append(producto)
+    def iterar_paginas(self, tamano_pagina=500, desde_codigo=None, incluir_desde=False, hasta_codigo=None):
+        '''
+        Recorre el catálogo por páginas usando paginación por clave (codigo > último código leído),
+        así cada consulta trae como máximo tamano_pagina filas y la memoria no depende del total.
+        Con incluir_desde la primera página empieza en desde_codigo (>=) en lugar de después.
+        Con hasta_codigo se detiene antes de ese código (codigo < hasta_codigo).
+        La conexión se devuelve al pool entre página y página.
+        Si no se puede leer una página lanza la excepción: cortar el recorrido en silencio
+        haría pasar un catálogo incompleto por completo (réplicas, exportaciones).
+        codigo es char en la BBDD, por lo que el orden es el de texto ('10' va antes que '9')
+        '''
+        incluir_desde = incluir_desde and desde_codigo is not None
+        while True:
+            pagina = self.leer_pagina(tamano_pagina, desde_codigo, incluir_desde, hasta_codigo)
+            if not pagina:
+                return
+            yield pagina
 
-        except Exception as e:
-            print(f'Error al mostrar todos los productos: {e}')
+            if len(pagina) < tamano_pagina:
+                return
+            desde_codigo = pagina[-1].codigo
+            incluir_desde = False
+
+    def particionar_codigos(self, particiones):
+        '''
+        Divide el catálogo en hasta particiones rangos de códigos con la misma cantidad de productos.
+        Devuelve [(desde, hasta), ...] en orden para iterar_paginas(desde_codigo=desde, incluir_desde=True, hasta_codigo=hasta):
+        None en un extremo significa sin límite. Devuelve None si hubo un error
+        '''
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM producto')
+                total = cursor.fetchone()[0]
+
+                limites = []
+                for numero in range(1, particiones):
+                    cursor.execute('SELECT codigo FROM producto ORDER BY codigo LIMIT 1 OFFSET %s', (total * numero // particiones,))
+                    fila = cursor.fetchone()
+                    if fila and (not limites or fila[0] != limites[-1]): ### Con menos productos que particiones se repiten
+                        limites.append(fila[0])
+        except Error as e:
+            print(f'Error al particionar el catálogo: {e}')
+        else:
+            extremos = [None, *limites, None]
+            return list(zip(extremos, extremos[1:]))
+        finally:
+            self._cerrar(connection)
+
+    def iterar_productos(self, batch_size=500, desde_codigo=None):
+        '''
+        Igual que iterar_paginas pero devuelve los productos de a uno
+        '''
+        for pagina in self.iterar_paginas(batch_size, desde_codigo):
+            yield from pagina
+
+    @instrumentado
+    def buscar_productos(self, nombre=None, nombre_prefijo=None, precio_min=None, precio_max=None,
+                         cantidad_min=None, cantidad_max=None, categoria=None,
+                         vencimiento_desde=None, vencimiento_hasta=None,
+                         orden='codigo', descendente=False, limite=50, desplazamiento=0, despues_de=None):
+        '''
+        Busca productos filtrando en la BBDD (los filtros en None no se aplican):
+        - nombre: contiene el texto / nombre_prefijo: empieza con el texto (este último aprovecha el índice)
+        - precio_min/precio_max, cantidad_min/cantidad_max: rangos inclusivos
+        - categoria: sólo electrónicos de esa categoría
+        - vencimiento_desde/vencimiento_hasta: sólo alimenticios con vencimiento en ese rango
+        Ordena por orden (codigo, nombre, precio, cantidad o vencimiento; este último sólo trae alimenticios) y pagina con limite/desplazamiento
+        o, para páginas profundas, con despues_de=(valor de orden, codigo) del último producto de la página anterior.
+        Devuelve la lista de productos o None si hubo un error (también sin conexión)
+        '''
+        columnas_orden = {
+            'codigo': 'p.codigo', 'nombre': 'p.nombre', 'precio': 'p.precio',
+            'cantidad': 'p.cantidad', 'vencimiento': 'pa.vencimiento',
+        }
+        if orden not in columnas_orden:
+            raise ValueError(f'No se puede ordenar por {orden}. Opciones: {", ".join(columnas_orden)}')
+        columna = columnas_orden[orden]
+
+        def escapar_like(texto): ### Con ESCAPE '!' (igual en MySQL y SQLite)
+            return str(texto).replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+        condiciones = []
+        parametros = []
+        for condicion, valor in (
+            ("p.nombre LIKE %s ESCAPE '!'", None if nombre is None else f'%{escapar_like(nombre)}%'),
+            ("p.nombre LIKE %s ESCAPE '!'", None if nombre_prefijo is None else f'{escapar_like(nombre_prefijo)}%'),
+            ('p.precio >= %s', precio_min),
+            ('p.precio <= %s', precio_max),
+            ('p.cantidad >= %s', cantidad_min),
+            ('p.cantidad <= %s', cantidad_max),
+            ('pe.categoria = %s', categoria),
+            ('pa.vencimiento >= %s', None if vencimiento_desde is None else parsear_fecha(vencimiento_desde)),
+            ('pa.vencimiento <= %s', None if vencimiento_hasta is None else parsear_fecha(vencimiento_hasta)),
+        ):
+            if valor is not None:
+                condiciones.append(condicion)
+                parametros.append(valor)
+        if orden == 'vencimiento':
+            ### Los demás tienen vencimiento NULL: una página que terminara en uno cortaría la paginación por clave (> NULL no da nada)
+            condiciones.append('pa.codigo IS NOT NULL')
+
+        if despues_de is not None:
+            valor_orden, codigo = despues_de
+            comparador = '<' if descendente else '>'
+            if orden == 'codigo':
+                condiciones.append(f'p.codigo {comparador} %s')
+                parametros.append(str(codigo))
+            else:
+                condiciones.append(f'({columna} {comparador} %s OR ({columna} = %s AND p.codigo {comparador} %s))')
+                parametros.extend((valor_orden, valor_orden, str(codigo)))
+
+        direccion = 'DESC' if descendente else 'ASC'
+        consulta = CONSULTA_PRODUCTOS
+        if condiciones:
+            consulta += 'WHERE ' + ' AND '.join(condiciones) + '\n'
+        consulta += f'ORDER BY {columna} {direccion}' + (f', p.codigo {direccion}' if orden != 'codigo' else '')
+        consulta += ' LIMIT %s OFFSET %s'
+        parametros.extend((int(limite), 0 if despues_de is not None else int(desplazamiento)))
+
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor(dictionary=True) as cursor:
+                cursor.execute(consulta, parametros)
+                productos = [self._construir_producto(producto_data) for producto_data in cursor.fetchall()]
+        except Error as e:
+            print(f'Error al buscar productos: {e}')
         else:
             return productos
         finally:
-            if connection.is_connected():
-                connection.close()
+            self._cerrar(connection)
+
+    @instrumentado
+    def proximos_a_vencer(self, dias, desde=None, limite=None):
+        '''
+        Productos alimenticios que vencen entre desde (hoy por defecto) y desde + dias, ordenados por vencimiento.
+        La consulta parte de productoalimenticio para recorrer sólo ese rango del índice de vencimiento.
+        Devuelve None si hubo un error (también sin conexión)
+        '''
+        desde = parsear_fecha(desde) if desde is not None else datetime.date.today()
+        hasta = desde + datetime.timedelta(days=dias)
+        consulta = '''
+        SELECT p.codigo, p.nombre, p.costo, p.precio, p.cantidad, 0 AS es_electronico, NULL AS categoria, pa.vencimiento
+        FROM productoalimenticio pa
+        JOIN producto p ON p.codigo = pa.codigo
+        WHERE pa.vencimiento BETWEEN %s AND %s
+        ORDER BY pa.vencimiento, pa.codigo
+        '''
+        parametros = [desde, hasta]
+        if limite is not None:
+            consulta += ' LIMIT %s'
+            parametros.append(int(limite))
+
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor(dictionary=True) as cursor:
+                cursor.execute(consulta, parametros)
+                productos = [self._construir_producto(producto_data) for producto_data in cursor.fetchall()]
+        except Error as e:
+            print(f'Error al buscar productos próximos a vencer: {e}')
+        else:
+            return productos
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
+    def cursor_cambios(self):
+        '''
+        Devuelve el último número de cambio registrado. Una réplica nueva lo toma ANTES de la carga completa
+        y después pide cambios_desde(ese cursor), así no pierde lo que cambie mientras carga
+        '''
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT MAX(id) FROM productocambio')
+                cursor_actual = cursor.fetchone()[0] or 0
+        except Error as e:
+            print(f'Error al leer el cursor de cambios: {e}')
+        else:
+            return cursor_actual
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
+    def cambios_desde(self, cursor_cambios=0, limite=10_000):
+        '''
+        Devuelve los productos creados, modificados o eliminados después de cursor_cambios:
+        {'cursor': nuevo cursor, 'actualizados': [productos en su estado actual], 'eliminados': [codigos], 'completo': si no quedan más}
+        Trae como máximo limite códigos; si completo es False hay que volver a llamar con el nuevo cursor.
+        Los números de cambio siguen el orden de los commits (ver _registrar_cambios): ninguno menor que el cursor aparece después
+        '''
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor(dictionary=True) as cursor:
+                cursor.execute('SELECT codigo, MAX(id) AS ultimo FROM productocambio WHERE id > %s GROUP BY codigo ORDER BY ultimo LIMIT %s',
+                               (cursor_cambios, limite))
+                cambios = cursor.fetchall()
+
+                actualizados = []
+                codigos = [cambio['codigo'] for cambio in cambios]
+                if codigos:
+                    marcadores = ', '.join(['%s'] * len(codigos))
+                    cursor.execute(CONSULTA_PRODUCTOS + f'WHERE p.codigo IN ({marcadores})', codigos)
+                    actualizados = [self._construir_producto(producto_data) for producto_data in cursor.fetchall()]
+
+                presentes = {producto.codigo for producto in actualizados}
+                resultado = {
+                    'cursor': max([cursor_cambios] + [cambio['ultimo'] for cambio in cambios]),
+                    'actualizados': actualizados,
+                    'eliminados': [int(codigo) for codigo in codigos if int(codigo) not in presentes],
+                    'completo': len(cambios) < limite,
+                }
+        except Error as e:
+            print(f'Error al leer los cambios: {e}')
+        else:
+            return resultado
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
+    def compactar_cambios(self):
+        '''
+        Borra de productocambio los renglones que tienen otro más nuevo para el mismo código: cambios_desde
+        sólo usa el último de cada código, así que ninguna réplica pierde nada y la tabla queda con un renglón por código.
+        Para correr periódicamente. Devuelve la cantidad de renglones borrados o None si hubo un error
+        '''
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                ### La tabla derivada se materializa antes de borrar (MySQL no deja leer en una subconsulta la tabla que se borra)
+                cursor.execute('''
+                DELETE FROM productocambio WHERE id NOT IN (
+                    SELECT ultimo FROM (SELECT MAX(id) AS ultimo FROM productocambio GROUP BY codigo) AS ultimos
+                )
+                ''')
+                borrados = cursor.rowcount
+                connection.commit()
+        except Error as e:
+            print(f'Error al compactar el registro de cambios: {e}')
+        else:
+            return borrados
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
+    def cargar_snapshot(self, tamano_bloque=50_000):
+        '''
+        Carga todo el inventario en un SnapshotInventario (columnas de NumPy) para análisis vectorizados
+        (valuación, márgenes, bajo stock, agrupamiento por categoría) sin armar objetos Producto.
+        Devuelve None si hubo un error (también sin conexión)
+        '''
+        from snapshot import SnapshotInventario ### NumPy sólo se necesita para esta función
 
+        def filas(cursor):
+            while True:
+                bloque = cursor.fetchmany(tamano_bloque)
+                if not bloque:
+                    return
+                yield from bloque
+
+        cursor_actual = self.cursor_cambios() ### Antes de leer: lo que cambie durante la carga se vuelve a pedir después
+        if cursor_actual is None:
+            return None
+        connection = self.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(CONSULTA_PRODUCTOS)
+                snapshot = SnapshotInventario.desde_filas(filas(cursor), cursor_actual)
+        except Error as e:
+            print(f'Error al cargar el snapshot del inventario: {e}')
+        else:
+            return snapshot
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
+    def exportar_snapshot(self, ruta, tamano_bloque=50_000):
+        '''
+        Guarda todo el inventario (producto y ambos subtipos) en un archivo binario columnar.
+        Devuelve el SnapshotInventario exportado o None si no se pudo leer la base
+        '''
+        snapshot = self.cargar_snapshot(tamano_bloque)
+        if snapshot is not None:
+            try:
+                snapshot.guardar(ruta)
+            except OSError as e:
+                print(f'Error al guardar el snapshot en {ruta}: {e}')
+                return None
+        return snapshot
+
+    @staticmethod
+    def abrir_snapshot(ruta):
+        '''
+        Abre un snapshot exportado mapeado en memoria: catálogo de sólo lectura listo en milisegundos,
+        sin pasar por la base ni armar objetos Producto
+        '''
+        from snapshot import SnapshotInventario
+
+        return SnapshotInventario.abrir(ruta)
+
+    @instrumentado
+    def restaurar_snapshot(self, ruta, tamano_lote=5000):
+        '''
+        Reemplaza todo el inventario de la base por el de un snapshot exportado, en una sola transacción:
+        si algo falla no queda nada a medias. Inserta con INSERT de varias filas (executemany) por tabla.
+        Devuelve la cantidad de productos restaurados o None si hubo un error
+        '''
+        try:
+            snapshot = self.abrir_snapshot(ruta)
+        except (OSError, ValueError) as e:
+            print(f'Error al abrir el snapshot {ruta}: {e}')
+            return None
+
+        if not self._vaciar_stock_diferido():
+            return None
+        try:
+            connection = self.connect()
+            if connection:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT codigo FROM producto')
+                    cambiados = [codigo for (codigo,) in cursor.fetchall()] ### Bajas para las réplicas (los que vuelven quedan como cambio)
+                    cursor.execute('DELETE FROM productoelectronico')
+                    cursor.execute('DELETE FROM productoalimenticio')
+                    cursor.execute('DELETE FROM producto')
+
+                    for productos, electronicos, alimenticios in snapshot.bloques(tamano_lote):
+                        cursor.executemany('INSERT INTO producto (codigo, nombre, costo, precio, cantidad) VALUES (%s, %s, %s, %s, %s)', productos)
+                        if electronicos:
+                            cursor.executemany('INSERT INTO productoelectronico (codigo, categoria) VALUES (%s, %s)', electronicos)
+                        if alimenticios:
+                            cursor.executemany('INSERT INTO productoalimenticio (codigo, vencimiento) VALUES (%s, %s)', alimenticios)
+                        cambiados.extend(str(valores[0]) for valores in productos)
+
+                    self._registrar_cambios(cursor, cambiados)
+                    connection.commit()
+                    if self.cache:
+                        self.cache.limpiar()
+                    print(f'Se restauraron {len(snapshot)} productos desde {ruta}')
+        except Error as e:
+            connection.rollback()
+            print(f'Error al restaurar el snapshot: {e}')
+        else:
+            return len(snapshot)
+        finally:
+            self._cerrar(connection)
+
+    @instrumentado
     def eliminar_registros(self):
+        if not self._vaciar_stock_diferido():
+            return
         try:
             connection = self.connect()
             if connection:
                 with connection.cursor() as cursor:
+                    cursor.execute('SELECT codigo FROM producto')
+                    eliminados = [codigo for (codigo,) in cursor.fetchall()] ### Una baja por producto para las réplicas
                     cursor.execute('DELETE FROM productoelectronico')
                     cursor.execute('DELETE FROM productoalimenticio')
                     cursor.execute('DELETE FROM producto')
                     
                     if cursor.rowcount > 0: ### Mayor a cero porque todavía no fueron guardados los cambios
+                        self._registrar_cambios(cursor, eliminados)
                         connection.commit()
+                        if self.cache:
+                            self.cache.limpiar()
                         print('Todos los productos fueron eliminados exitosamente')
         except Exception as e:
             print(f'Ocurrió un error al eliminar todos los productos: {e}')
             input('Presione una tecla para continuar...')
         finally:
-            if connection.is_connected():
-                connection.close()
+            self._cerrar(connection)
@@ -0,0 +1,168 @@
+'''
+Versión asíncrona (asyncio) de GestionProductos
+
+Usa aiomysql con un pool de conexiones asíncrono: miles de consultas concurrentes
+comparten unas pocas conexiones sin ocupar un hilo por pedido
+'''
+# Librerías necesarias
+import asyncio
+
+import aiomysql
+from aiomysql import Error
+from decouple import config
+
+from inventory import (
+    CONSULTA_PRODUCTOS,
+    ProductoElectronico,
+    ProductoAlimenticio,
+    GestionProductos
+)
+
+async def registrar_cambio(cursor, codigo):
+    '''
+    Igual que GestionProductos._registrar_cambios: bloquea productocambioorden hasta el commit
+    para que los id de productocambio queden en el orden de los commits
+    '''
+    await cursor.execute('SELECT id FROM productocambioorden WHERE id = 1 FOR UPDATE')
+    await cursor.execute('INSERT INTO productocambio (codigo) VALUES (%s)', (str(codigo),))
+
+# Clase de gestion asíncrona
+class AsyncGestionProductos():
+    def __init__(self) -> None:
+        self.host = config('DB_HOST')
+        self.name = config('DB_NAME')
+        self.user = config('DB_USER')
+        self.password = config('DB_PASS')
+        self.port = config('DB_PORT', cast=int)
+        self.pool_size = config('DB_POOL_SIZE', default=5, cast=int)
+        self.pool = None
+        self._lock_pool = None
+
+    async def obtener_pool(self):
+        '''
+        Crea el pool de conexiones la primera vez que se necesita
+        '''
+        if self._lock_pool is None:
+            self._lock_pool = asyncio.Lock()
+        async with self._lock_pool:
+            if self.pool is None:
+                self.pool = await aiomysql.create_pool(
+                    minsize = 1,
+                    maxsize = self.pool_size,
+                    pool_recycle = 3600, ### Renueva conexiones viejas antes de que el servidor las corte
+                    autocommit = True, ### Las lecturas no dejan transacciones abiertas (el pool cierra las conexiones que vuelven con una)
+                    host = self.host,
+                    db = self.name,
+                    user = self.user,
+                    password = self.password,
+                    port = self.port
+                )
+            return self.pool
+
+    async def cerrar(self):
+        '''
+        Cierra todas las conexiones del pool
+        '''
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    async def crear_producto(self, producto):
+        codigo = str(producto.codigo) ### codigo es char: comparado con un número MySQL no usa la clave primaria y recorre toda la tabla
+        try:
+            pool = await self.obtener_pool()
+            async with pool.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await connection.begin() ### Con autocommit las escrituras de varias sentencias abren su transacción
+                    ### Verificamos si existe el codigo
+                    await cursor.execute('SELECT codigo FROM producto WHERE codigo = %s', (codigo,))
+                    if await cursor.fetchone():
+                        await connection.rollback()
+                        print('Ya existe un producto con ese código')
+                        return
+
+                    ### Insertar producto y luego producto por tipo
+                    await cursor.execute('INSERT INTO producto (codigo, nombre, costo, precio, cantidad) VALUES (%s, %s, %s, %s, %s)',
+                                         (codigo, producto.nombre, producto.costo, producto.precio, producto.cantidad))
+                    if isinstance(producto, ProductoElectronico):
+                        await cursor.execute('INSERT INTO productoelectronico (codigo, categoria) VALUES (%s, %s)',
+                                             (codigo, producto.categoria))
+                    elif isinstance(producto, ProductoAlimenticio):
+                        await cursor.execute('INSERT INTO productoalimenticio (codigo, vencimiento) VALUES (%s, %s)',
+                                             (codigo, producto.vencimiento))
+
+                    await registrar_cambio(cursor, codigo)
+                    await connection.commit()
+                    print(f'Producto {producto.nombre} creado exitosamente')
+        except Error as e:
+            print(f'Error inesperado al crear producto: {e}')
+
+    async def leer_producto(self, codigo):
+        '''
+        Buscar producto por código (una sola consulta con los datos de su tipo)
+        '''
+        codigo = str(codigo) ### Como texto, para que MySQL use la clave primaria
+        try:
+            pool = await self.obtener_pool()
+            async with pool.acquire() as connection:
+                async with connection.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(CONSULTA_PRODUCTOS + 'WHERE p.codigo = %s', (codigo,))
+                    datos_producto = await cursor.fetchone()
+        except Error as e:
+            print(f'Error al leer producto: {e}')
+        else:
+            return GestionProductos._construir_producto(datos_producto) if datos_producto else None
+
+    async def actualizar_producto(self, codigo, nuevo_costo, nuevo_precio, nueva_cantidad):
+        codigo = str(codigo) ### Como texto: sin la clave primaria MySQL bloquea todas las filas y las escrituras se hacen de a una
+        try:
+            pool = await self.obtener_pool()
+            async with pool.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await connection.begin()
+                    filas = await cursor.execute('UPDATE producto SET costo = %s, precio = %s, cantidad = %s WHERE codigo = %s',
+                                                 (nuevo_costo, nuevo_precio, nueva_cantidad, codigo))
+                    if filas > 0:
+                        await registrar_cambio(cursor, codigo)
+                        await connection.commit()
+                        print('Los datos se guardaron correctamente')
+                    else:
+                        await connection.rollback()
+                        ### Sin filas afectadas: el producto no existe o ya tenía esos mismos datos
+                        await cursor.execute('SELECT codigo FROM producto WHERE codigo = %s', (codigo,))
+                        if not await cursor.fetchone():
+                            print(f'Producto de código {codigo} inexistente')
+        except Error as e:
+            print(f'Error al actualizar el producto: {e}')
+
+    async def eliminar_producto(self, codigo):
+        codigo = str(codigo) ### Como texto: sin la clave primaria MySQL bloquea todas las filas y las escrituras se hacen de a una
+        try:
+            pool = await self.obtener_pool()
+            async with pool.acquire() as connection:
+                async with connection.cursor() as cursor:
+                    await connection.begin()
+                    await cursor.execute('DELETE FROM productoelectronico WHERE codigo = %s', (codigo,))
+                    await cursor.execute('DELETE FROM productoalimenticio WHERE codigo = %s', (codigo,))
+                    if await cursor.execute('DELETE FROM producto WHERE codigo = %s', (codigo,)) > 0:
+                        await registrar_cambio(cursor, codigo)
+                        await connection.commit()
+                        print(f'Producto de codigo: {codigo} eliminado correctamente')
+                    else:
+                        await connection.rollback()
+                        print(f'No se encontro producto con codigo {codigo}')
+        except Error as e:
+            print(f'Error al eliminar el producto: {e}')
+
+    async def leer_todos_los_productos(self):
+        try:
+            pool = await self.obtener_pool()
+            async with pool.acquire() as connection:
+                async with connection.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(CONSULTA_PRODUCTOS)
+                    productos_data = await cursor.fetchall()
+        except Error as e:
+            print(f'Error al mostrar todos los productos: {e}')
+        else:
+            return [GestionProductos._construir_producto(producto_data) for producto_data in productos_data]
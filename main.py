@@ -1,6 +1,8 @@
 #Imports
 import os
 import platform
+import threading
+import time
 
 from inventory import (
     ProductoElectronico,
@@ -8,6 +10,62 @@ from inventory import (
     GestionProductos
 )
 
+# Listado paginado
+TAMANO_PAGINA = 20
+PAGINAS_ADELANTADAS = 2
+TIEMPO_MAXIMO_PRIMERA_FILA = 0.5 ### Segundos. Cada página es una consulta con LIMIT, no depende del tamaño del catálogo
+
+class PaginadorProductos():
+    '''
+    Trae las páginas del catálogo en un hilo aparte, PAGINAS_ADELANTADAS por delante de la que se está mirando,
+    así al pasar de página normalmente ya está cargada
+    '''
+    def __init__(self, gestion: GestionProductos, desde_codigo=None) -> None:
+        self.gestion = gestion
+        self.desde_codigo = desde_codigo
+        self.paginas = []
+        self.terminado = False
+        self.error = None ### Error que cortó la carga (las páginas ya cargadas se pueden seguir mirando)
+        self._pedidas = 1 + PAGINAS_ADELANTADAS
+        self._cancelado = False
+        self._condicion = threading.Condition()
+        self._hilo = threading.Thread(target=self._cargar, daemon=True)
+        self._hilo.start()
+
+    def _cargar(self):
+        try:
+            for pagina in self.gestion.iterar_paginas(TAMANO_PAGINA, self.desde_codigo, incluir_desde=True):
+                with self._condicion:
+                    self.paginas.append(pagina)
+                    self._condicion.notify_all()
+                    ### Espera a que se pidan más páginas antes de seguir leyendo
+                    while len(self.paginas) >= self._pedidas and not self._cancelado:
+                        self._condicion.wait()
+                    if self._cancelado:
+                        return
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._condicion:
+                self.terminado = True
+                self._condicion.notify_all()
+
+    def pagina(self, numero):
+        '''
+        Devuelve la página numero (desde 0), esperando si todavía se está cargando. None si no existe
+        '''
+        with self._condicion:
+            self._pedidas = max(self._pedidas, numero + 1 + PAGINAS_ADELANTADAS)
+            self._condicion.notify_all()
+            while len(self.paginas) <= numero and not self.terminado:
+                self._condicion.wait()
+            return self.paginas[numero] if numero < len(self.paginas) else None
+
+    def cancelar(self):
+        with self._condicion:
+            self._cancelado = True
+            self._condicion.notify_all()
+
 def limpiar_pantalla():
     '''
     Limpiar la pantalla según OS
@@ -45,7 +103,7 @@ def agregar_producto(gestion: GestionProductos, tipo_producto):
             producto = ProductoElectronico(codigo, nombre, costo, 
                                                 precio, cantidad, categoria)
         elif tipo_producto == '2':
-            vencimiento = input('Ingrese vencimiento: ')
+            vencimiento = input('Ingrese vencimiento (AAAA-MM-DD o DD/MM/AAAA): ')
             producto = ProductoAlimenticio(codigo, nombre, costo, 
                                                 precio, cantidad, vencimiento)
         else:
@@ -99,20 +157,60 @@ def eliminar_producto_por_codigo(gestion: GestionProductos):
         input('Presione una tecla para continuar...')
 
 def mostrar_todos_los_productos(gestion: GestionProductos):
-    print('=== Listado completo de productos ===')
-    
+    '''
+    Listado paginado: muestra la primera página apenas llega mientras las siguientes se cargan en segundo plano
+    '''
     try:
-        productos = gestion.leer_todos_los_productos()
-        for producto in productos:
-            if isinstance(producto, ProductoElectronico):
-                print(f'{producto.codigo} {producto.nombre} {producto.precio}')
-            elif isinstance(producto, ProductoAlimenticio):
-                print(f'{producto.codigo} {producto.nombre} {producto.precio}')
+        inicio = time.perf_counter()
+        paginador = PaginadorProductos(gestion)
+        numero = 0
+        pagina = paginador.pagina(numero)
+        tiempo_primera_fila = time.perf_counter() - inicio
+
+        while True:
+            limpiar_pantalla()
+            print(f'=== Listado de productos - página {numero + 1} ===')
+            if not pagina:
+                print('No hay productos para mostrar')
+            else:
+                for producto in pagina:
+                    if isinstance(producto, ProductoElectronico):
+                        print(f'{producto.codigo} {producto.nombre} {producto.precio}')
+                    elif isinstance(producto, ProductoAlimenticio):
+                        print(f'{producto.codigo} {producto.nombre} {producto.precio}')
+            print('=== /// === /// ===')
+            if paginador.error:
+                print(f'No se pudieron cargar más productos: {paginador.error}')
+            aviso = ' (supera el máximo esperado)' if tiempo_primera_fila > TIEMPO_MAXIMO_PRIMERA_FILA else ''
+            print(f'Primera fila en {tiempo_primera_fila * 1000:.0f} ms{aviso}')
+
+            opcion = input('[s] siguiente  [a] anterior  [c] ir a código  [v] volver: ').lower()
+            if opcion == 's':
+                siguiente = paginador.pagina(numero + 1)
+                if siguiente:
+                    numero, pagina = numero + 1, siguiente
+            elif opcion == 'a' and numero > 0:
+                numero -= 1
+                pagina = paginador.pagina(numero)
+            elif opcion == 'c':
+                try:
+                    codigo = int(input('Ingrese el código: '))
+                except ValueError as e:
+                    print(f'Tipo de dato equivocado: {e}')
+                    input('Presione una tecla para continuar...')
+                    continue
+                paginador.cancelar()
+                inicio = time.perf_counter()
+                paginador = PaginadorProductos(gestion, desde_codigo=codigo)
+                numero = 0
+                pagina = paginador.pagina(numero)
+                tiempo_primera_fila = time.perf_counter() - inicio
+            elif opcion == 'v':
+                paginador.cancelar()
+                return
     except Exception as e:
         print(f'Error al mostrar todos los productos {e}')
-        
-    print('=== /// === /// ===')
-    input('Presione una tecla para continuar')
+        input('Presione una tecla para continuar')
 
 def eliminar_todos_los_productos(gestion: GestionProductos):
     try:
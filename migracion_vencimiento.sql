@@ -0,0 +1,37 @@
+-- Migración: ProductoAlimenticio.vencimiento de char(20) a date --
+-- Para bases creadas con la versión anterior de products.sql (las nuevas ya tienen la columna date)
+-- Sólo MySQL: en SQLite BackendSQLite convierte los vencimientos a AAAA-MM-DD al abrir la base
+-- Correr con el cliente mysql sin --force: si una sentencia falla, el resto no se ejecuta
+USE productos;
+
+ALTER TABLE ProductoAlimenticio ADD COLUMN vencimiento_fecha date NULL;
+
+-- Formatos aceptados: AAAA-MM-DD, DD/MM/AAAA y DD-MM-AAAA (fechas imposibles como 31/02/2024 quedan en NULL) --
+UPDATE ProductoAlimenticio SET vencimiento_fecha = CASE
+    WHEN vencimiento REGEXP '^[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}$' THEN STR_TO_DATE(vencimiento, '%Y-%m-%d')
+    WHEN vencimiento REGEXP '^[0-9]{1,2}/[0-9]{1,2}/[0-9]{4}$' THEN STR_TO_DATE(vencimiento, '%d/%m/%Y')
+    WHEN vencimiento REGEXP '^[0-9]{1,2}-[0-9]{1,2}-[0-9]{4}$' THEN STR_TO_DATE(vencimiento, '%d-%m-%Y')
+END;
+
+-- Fechas que no se pudieron convertir --
+SELECT codigo, vencimiento FROM ProductoAlimenticio WHERE vencimiento_fecha IS NULL;
+
+-- Corta la migración si quedó alguna sin convertir: corregir vencimiento_fecha a mano (el texto original sigue en vencimiento) --
+-- y volver a correr desde acá --
+DROP PROCEDURE IF EXISTS verificar_vencimientos;
+DELIMITER //
+CREATE PROCEDURE verificar_vencimientos()
+BEGIN
+    IF EXISTS (SELECT 1 FROM ProductoAlimenticio WHERE vencimiento_fecha IS NULL) THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Hay vencimientos sin convertir: la columna original no se modificó';
+    END IF;
+END //
+DELIMITER ;
+CALL verificar_vencimientos();
+DROP PROCEDURE verificar_vencimientos;
+
+-- El texto original se conserva en vencimiento_texto; borrarlo a mano después de revisar los datos: --
+-- ALTER TABLE ProductoAlimenticio DROP COLUMN vencimiento_texto; --
+ALTER TABLE ProductoAlimenticio CHANGE COLUMN vencimiento vencimiento_texto char(20) NULL;
+ALTER TABLE ProductoAlimenticio CHANGE COLUMN vencimiento_fecha vencimiento date not null;
+CREATE INDEX idx_productoalimenticio_vencimiento ON ProductoAlimenticio(vencimiento);
@@ -18,9 +18,35 @@ CREATE TABLE ProductoElectronico(
 
 CREATE TABLE ProductoAlimenticio(
 	codigo char(8) primary key,  
-    vencimiento char(20) not null,
+    vencimiento date not null,
     FOREIGN KEY (codigo) REFERENCES Producto(codigo)
 );
 
+-- Registro de cambios para las réplicas (cambios_desde): un renglón por código creado, modificado o eliminado --
+CREATE TABLE ProductoCambio(
+	id integer primary key auto_increment,
+    codigo char(8) not null
+);
+
+-- Una sola fila: cada escritura la bloquea (FOR UPDATE) justo antes de anotar sus cambios y la suelta con el commit. --
+-- Así los id de ProductoCambio se asignan en el orden de los commits y una réplica nunca saltea uno confirmado tarde --
+CREATE TABLE ProductoCambioOrden(
+	id integer primary key
+);
+
+INSERT INTO ProductoCambioOrden (id) VALUES (1);
+
+-- Lotes de la escritura diferida del stock ya guardados (stock_diferido.py), para no aplicar dos veces un journal recuperado --
+CREATE TABLE StockLote(
+	lote char(32) primary key
+);
+
+-- Índices para buscar_productos (InnoDB agrega la clave primaria a cada índice, lo que sirve al orden por codigo) --
+CREATE INDEX idx_producto_nombre ON Producto(nombre);
+CREATE INDEX idx_producto_precio ON Producto(precio);
+CREATE INDEX idx_producto_cantidad ON Producto(cantidad);
+CREATE INDEX idx_productoelectronico_categoria ON ProductoElectronico(categoria);
+CREATE INDEX idx_productoalimenticio_vencimiento ON ProductoAlimenticio(vencimiento);
+
 -- Consultas --
 SELECT * FROM producto;
\ No newline at end of file
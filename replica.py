@@ -0,0 +1,81 @@
+'''
+Réplica local del catálogo
+
+Mantiene en memoria una copia de todos los productos y la actualiza con GestionProductos.cambios_desde,
+así cada refresco trae sólo lo que cambió desde el anterior y no la tabla completa
+'''
+# Librerías necesarias
+import threading
+
+from almacenamiento import Error
+from inventory import GestionProductos, IndiceVencimientos
+
+class ReplicaCatalogo():
+    def __init__(self, gestion: GestionProductos, limite=10_000) -> None:
+        self.gestion = gestion
+        self.limite = limite
+        self.productos = {} ### codigo -> producto
+        self.cursor = None ### Último cambio aplicado (None: todavía no se cargó)
+        self.vencimientos = IndiceVencimientos()
+        self._lock = threading.Lock()
+
+    def cargar(self):
+        '''
+        Carga completa: toma el cursor de cambios antes de leer para no perder lo que cambie mientras tanto
+        '''
+        cursor = self.gestion.cursor_cambios()
+        if cursor is None:
+            return False
+        try:
+            productos = {producto.codigo: producto for producto in self.gestion.iterar_productos()}
+        except (ConnectionError, *Error): ### Carga incompleta: no se da por cargada (los cambios nunca traerían lo que falta)
+            return False
+        vencimientos = IndiceVencimientos(productos.values())
+        with self._lock:
+            self.productos = productos
+            self.vencimientos = vencimientos
+            self.cursor = cursor
+        return True
+
+    def sincronizar(self):
+        '''
+        Aplica los cambios pendientes (o hace la carga completa la primera vez).
+        Devuelve {'actualizados': cantidad, 'eliminados': cantidad} o None si no se pudo leer
+        '''
+        if self.cursor is None:
+            if not self.cargar():
+                return None
+            return {'actualizados': len(self.productos), 'eliminados': 0}
+
+        actualizados = eliminados = 0
+        while True:
+            cambios = self.gestion.cambios_desde(self.cursor, limite=self.limite)
+            if cambios is None:
+                return None
+            with self._lock:
+                for producto in cambios['actualizados']:
+                    self.productos[producto.codigo] = producto
+                    self.vencimientos.actualizar(producto)
+                for codigo in cambios['eliminados']:
+                    self.productos.pop(codigo, None)
+                    self.vencimientos.quitar(codigo)
+                self.cursor = cambios['cursor']
+            actualizados += len(cambios['actualizados'])
+            eliminados += len(cambios['eliminados'])
+            if cambios['completo']:
+                return {'actualizados': actualizados, 'eliminados': eliminados}
+
+    def obtener(self, codigo):
+        return self.productos.get(int(codigo))
+
+    def proximos_a_vencer(self, dias, desde=None):
+        '''
+        Productos de la réplica que vencen en los próximos dias (sin consultar la BBDD)
+        '''
+        return [self.productos[codigo] for _, codigo in self.vencimientos.proximos_a_vencer(dias, desde)]
+
+    def __len__(self):
+        return len(self.productos)
+
+    def __iter__(self):
+        return iter(list(self.productos.values()))
@@ -0,0 +1,285 @@
+'''
+Snapshot columnar del inventario
+
+Guarda cada columna de producto (y las de los subtipos) en un arreglo de NumPy ordenado por código,
+para calcular valuaciones, márgenes y agrupamientos sin armar un objeto Producto por fila.
+Se puede guardar en un archivo binario (guardar) y abrirlo después mapeado en memoria (abrir):
+las columnas se leen directo del archivo, sin copiarlas ni convertirlas en objetos de Python
+'''
+# Librerías necesarias
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Tipos de producto en la columna tipo
+TIPO_BASE = 0
+TIPO_ELECTRONICO = 1
+TIPO_ALIMENTICIO = 2
+
+# Formato del archivo: [firma][posición y largo de la cabecera JSON][columnas alineadas][cabecera JSON]
+FIRMA = b'INVSNAP1'
+PREAMBULO = struct.Struct('<8sQQ')
+ALINEACION = 64
+
+class ColumnaTexto():
+    '''
+    Columna de textos guardada como un único bloque UTF-8 (datos) más dónde empieza cada valor (desplazamientos),
+    así se escribe y se mapea desde el archivo igual que las columnas numéricas
+    '''
+    def __init__(self, desplazamientos, datos) -> None:
+        self.desplazamientos = desplazamientos
+        self.datos = datos
+
+    @classmethod
+    def desde_textos(cls, textos):
+        codificados = [texto.encode('utf-8') for texto in textos]
+        desplazamientos = np.zeros(len(codificados) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, codificados), dtype=np.int64, count=len(codificados)), out=desplazamientos[1:])
+        return cls(desplazamientos, np.frombuffer(b''.join(codificados), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.desplazamientos) - 1
+
+    def __getitem__(self, posicion):
+        return self.datos[self.desplazamientos[posicion]:self.desplazamientos[posicion + 1]].tobytes().decode('utf-8')
+
+class SnapshotInventario():
+    def __init__(self, codigo, nombre, costo, precio, cantidad, tipo, categoria_id, categorias, vencimiento, cursor_cambios=None) -> None:
+        '''
+        Recibe las columnas ya ordenadas por código (ver desde_filas y abrir).
+        categoria_id es el índice de la categoría en categorias ('' para los que no tienen) y
+        vencimiento es datetime64[D] (NaT para los que no tienen)
+        '''
+        self.codigo = codigo
+        self.nombre = nombre
+        self.costo = costo
+        self.precio = precio
+        self.cantidad = cantidad
+        self.tipo = tipo
+        self.categoria_id = categoria_id
+        self.categorias = categorias
+        self.vencimiento = vencimiento
+        self.cursor_cambios = cursor_cambios ### Último cambio incluido: una réplica sigue con cambios_desde(cursor_cambios)
+
+    @classmethod
+    def desde_filas(cls, filas, cursor_cambios=None):
+        '''
+        Arma el snapshot a partir de tuplas (codigo, nombre, costo, precio, cantidad, es_electronico, categoria, vencimiento),
+        las mismas columnas que CONSULTA_PRODUCTOS
+        '''
+        columnas = list(zip(*filas)) or [()] * 8
+        codigo, nombre, costo, precio, cantidad, es_electronico, categoria, vencimiento = columnas
+
+        codigo = np.fromiter(map(int, codigo), dtype=np.int64, count=len(codigo))
+        orden = np.argsort(codigo, kind='stable')
+        vencimiento = np.array(vencimiento, dtype='datetime64[D]').reshape(-1)[orden] ### Acepta fechas o textos AAAA-MM-DD; None queda NaT
+        es_electronico = np.asarray(es_electronico, dtype=bool)[orden]
+        tipo = np.where(es_electronico, TIPO_ELECTRONICO, np.where(np.isnat(vencimiento), TIPO_BASE, TIPO_ALIMENTICIO)).astype(np.int8)
+
+        ### Categorías codificadas como enteros (índice en categorias) para agrupar con bincount
+        ids = {}
+        categoria_id = np.fromiter(
+            (ids.setdefault(categoria[i] if categoria[i] is not None else '', len(ids)) for i in orden),
+            dtype=np.int32, count=len(orden))
+
+        return cls(
+            codigo[orden],
+            ColumnaTexto.desde_textos(nombre[i] for i in orden),
+            np.asarray(costo, dtype=np.float64)[orden],
+            np.asarray(precio, dtype=np.float64)[orden],
+            np.asarray(cantidad, dtype=np.int64)[orden],
+            tipo, categoria_id, list(ids), vencimiento, cursor_cambios)
+
+    def _columnas(self):
+        return {
+            'codigo': self.codigo,
+            'nombre_desplazamientos': self.nombre.desplazamientos,
+            'nombre_datos': self.nombre.datos,
+            'costo': self.costo,
+            'precio': self.precio,
+            'cantidad': self.cantidad,
+            'tipo': self.tipo,
+            'categoria_id': self.categoria_id,
+            'vencimiento': self.vencimiento,
+        }
+
+    ## Archivo binario
+    def guardar(self, ruta):
+        '''
+        Escribe el snapshot en un archivo binario columnar. Se escribe en un temporal y se renombra al final,
+        así nunca queda a medio escribir un snapshot que otro proceso pueda abrir
+        '''
+        temporal = f'{ruta}.tmp'
+        columnas = {}
+        with open(temporal, 'wb') as archivo:
+            archivo.write(b'\0' * ALINEACION) ### Lugar para el preámbulo, se completa al final
+            for nombre, arreglo in self._columnas().items():
+                arreglo = np.ascontiguousarray(arreglo)
+                columnas[nombre] = {'dtype': arreglo.dtype.str, 'inicio': archivo.tell(), 'cantidad': len(arreglo)}
+                archivo.write(arreglo.view(np.uint8).data) ### Los bytes tal cual (datetime64 no se exporta como buffer)
+                archivo.write(b'\0' * (-archivo.tell() % ALINEACION)) ### Cada columna empieza alineada
+
+            cabecera = json.dumps({
+                'filas': len(self),
+                'categorias': self.categorias,
+                'cursor_cambios': self.cursor_cambios,
+                'columnas': columnas,
+            }, ensure_ascii=False).encode('utf-8')
+            posicion_cabecera = archivo.tell()
+            archivo.write(cabecera)
+            archivo.seek(0)
+            archivo.write(PREAMBULO.pack(FIRMA, posicion_cabecera, len(cabecera)))
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def abrir(cls, ruta):
+        '''
+        Abre un archivo creado con guardar mapeándolo en memoria (sólo lectura).
+        No lee las columnas: el sistema operativo trae del disco las páginas a medida que se usan
+        '''
+        with open(ruta, 'rb') as archivo:
+            mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(mapa) < PREAMBULO.size:
+            raise ValueError(f'{ruta} no es un snapshot del inventario')
+        firma, posicion_cabecera, largo_cabecera = PREAMBULO.unpack_from(mapa)
+        if firma != FIRMA:
+            raise ValueError(f'{ruta} no es un snapshot del inventario')
+        cabecera = json.loads(mapa[posicion_cabecera:posicion_cabecera + largo_cabecera].decode('utf-8'))
+
+        columnas = {
+            nombre: np.frombuffer(mapa, dtype=np.dtype(columna['dtype']), count=columna['cantidad'], offset=columna['inicio'])
+            for nombre, columna in cabecera['columnas'].items()
+        }
+        return cls(
+            columnas['codigo'],
+            ColumnaTexto(columnas['nombre_desplazamientos'], columnas['nombre_datos']),
+            columnas['costo'], columnas['precio'], columnas['cantidad'], columnas['tipo'],
+            columnas['categoria_id'], cabecera['categorias'], columnas['vencimiento'], cabecera['cursor_cambios'])
+
+    def bloques(self, tamano):
+        '''
+        Recorre el snapshot de a tamano productos y devuelve, por bloque, las filas listas para insertar:
+        (filas de producto, filas de productoelectronico, filas de productoalimenticio)
+        '''
+        for inicio in range(0, len(self), tamano):
+            fin = min(inicio + tamano, len(self))
+            codigos = self.codigo[inicio:fin].tolist()
+            tipos = self.tipo[inicio:fin]
+            productos = list(zip(
+                codigos, (self.nombre[i] for i in range(inicio, fin)), self.costo[inicio:fin].tolist(),
+                self.precio[inicio:fin].tolist(), self.cantidad[inicio:fin].tolist()))
+
+            electronicos = np.flatnonzero(tipos == TIPO_ELECTRONICO)
+            alimenticios = np.flatnonzero(tipos == TIPO_ALIMENTICIO)
+            categorias = self.categoria_id[inicio:fin]
+            vencimientos = self.vencimiento[inicio:fin]
+            yield (
+                productos,
+                [(codigos[i], self.categorias[categorias[i]] or None) for i in electronicos],
+                list(zip((codigos[i] for i in alimenticios), vencimientos[alimenticios].astype(object).tolist())),
+            )
+
+    def __len__(self):
+        return len(self.codigo)
+
+    def posicion(self, codigo):
+        '''
+        Devuelve la posición del código en los arreglos (búsqueda binaria) o None si no está
+        '''
+        posicion = int(np.searchsorted(self.codigo, int(codigo)))
+        if posicion < len(self.codigo) and self.codigo[posicion] == int(codigo):
+            return posicion
+        return None
+
+    def fila(self, codigo):
+        posicion = self.posicion(codigo)
+        if posicion is None:
+            return None
+        return {
+            'codigo': int(self.codigo[posicion]),
+            'nombre': self.nombre[posicion],
+            'costo': float(self.costo[posicion]),
+            'precio': float(self.precio[posicion]),
+            'cantidad': int(self.cantidad[posicion]),
+            'categoria': (self.categorias[self.categoria_id[posicion]] or None) if self.tipo[posicion] == TIPO_ELECTRONICO else None,
+            'vencimiento': self.vencimiento[posicion].astype(object) if not np.isnat(self.vencimiento[posicion]) else None,
+        }
+
+    ## Valuación
+    def valor_costo(self):
+        '''
+        Valor del stock al costo: suma de costo * cantidad
+        '''
+        return float(np.dot(self.costo, self.cantidad))
+
+    def valor_venta(self):
+        '''
+        Valor del stock al precio de venta: suma de precio * cantidad
+        '''
+        return float(np.dot(self.precio, self.cantidad))
+
+    ## Márgenes
+    def margen(self):
+        '''
+        Margen por unidad de cada producto (precio - costo)
+        '''
+        return self.precio - self.costo
+
+    def margen_porcentual(self):
+        '''
+        Margen sobre el precio de venta de cada producto (0.25 = 25 %)
+        '''
+        return np.divide(self.precio - self.costo, self.precio, out=np.zeros_like(self.precio), where=self.precio != 0)
+
+    def distribucion_margen(self, intervalos=10):
+        '''
+        Histograma del margen porcentual: devuelve (cantidad de productos por intervalo, bordes de los intervalos)
+        '''
+        margenes = self.margen_porcentual()
+        rango = None
+        if len(margenes) and margenes.max() - margenes.min() < 1e-9: ### Todos iguales: NumPy no puede partir un rango nulo
+            rango = (margenes.min() - 0.5, margenes.max() + 0.5)
+        return np.histogram(margenes, bins=intervalos, range=rango)
+
+    def percentiles_margen(self, percentiles=(5, 25, 50, 75, 95)):
+        valores = np.percentile(self.margen_porcentual(), percentiles) if len(self) else [0.0] * len(percentiles)
+        return dict(zip(percentiles, (float(valor) for valor in valores)))
+
+    ## Stock
+    def bajo_stock(self, umbral):
+        '''
+        Códigos de los productos con cantidad menor al umbral de reposición
+        '''
+        return self.codigo[self.cantidad < umbral]
+
+    ## Agrupamientos
+    def por_categoria(self):
+        '''
+        Agrupa los productos electrónicos por categoría:
+        categoria -> productos, unidades, valor al costo y valor de venta
+        '''
+        electronicos = self.tipo == TIPO_ELECTRONICO
+        grupo = self.categoria_id[electronicos]
+        cantidad = self.cantidad[electronicos]
+        total = len(self.categorias)
+        productos = np.bincount(grupo, minlength=total)
+        unidades = np.bincount(grupo, weights=cantidad, minlength=total)
+        valor_costo = np.bincount(grupo, weights=self.costo[electronicos] * cantidad, minlength=total)
+        valor_venta = np.bincount(grupo, weights=self.precio[electronicos] * cantidad, minlength=total)
+
+        return {
+            nombre: {
+                'productos': int(productos[i]),
+                'unidades': int(unidades[i]),
+                'valor_costo': float(valor_costo[i]),
+                'valor_venta': float(valor_venta[i]),
+            }
+            for i, nombre in enumerate(self.categorias)
+            if productos[i] > 0 ### Sólo categorías con productos electrónicos
+        }
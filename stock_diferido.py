@@ -0,0 +1,437 @@
+'''
+Escritura diferida del stock (write-behind) para GestionProductos
+
+Los ajustes de stock (ventas, devoluciones) se suman por código en memoria y se guardan
+todos juntos en una sola transacción cada intervalo_ms o cada max_cambios ajustes:
+cien ventas del mismo producto terminan en un único UPDATE y un único commit.
+
+Cada ajuste se anota antes en un journal local (un archivo por lote, con fsync), así un corte
+no pierde nada: al volver a activar el buffer se aplican los lotes que quedaron sin guardar.
+El directorio del journal queda bloqueado mientras el buffer está activo: cada proceso necesita el suyo,
+porque al arrancar se aplican todos los lotes que encuentra.
+Cada lote guardado se anota en la tabla stocklote en la misma transacción, para no aplicarlo dos veces.
+
+leer_producto y leer_productos del mismo proceso ven los ajustes pendientes (read-your-writes);
+los listados y reportes ven sólo lo que ya está guardado en la BBDD
+'''
+# Librerías necesarias
+import atexit
+import collections
+import copy
+import os
+import platform
+import threading
+import time
+import uuid
+
+from almacenamiento import Error
+from instrumentacion import Histograma
+
+if platform.system() == 'Windows':
+    import msvcrt
+else:
+    import fcntl
+
+class Lote():
+    __slots__ = ('nombre', 'deltas', 'cambios', 'recuperado')
+
+    def __init__(self, nombre, deltas, cambios, recuperado=False) -> None:
+        self.nombre = nombre
+        self.deltas = deltas ### {codigo: suma de los deltas}
+        self.cambios = cambios ### Ajustes individuales que se sumaron en deltas
+        self.recuperado = recuperado ### Leído del journal al arrancar: puede que ya se haya guardado
+
+def leer_journal(ruta):
+    '''
+    Devuelve ({codigo: suma de los deltas}, cantidad de ajustes) de un archivo de journal.
+    Un último renglón sin salto de línea quedó a medio escribir: ese ajuste nunca se confirmó y se descarta
+    '''
+    deltas = {}
+    cambios = 0
+    with open(ruta, encoding='utf-8') as archivo:
+        for linea in archivo:
+            if not linea.endswith('\n'):
+                break
+            movimientos = linea.split()
+            for movimiento in movimientos:
+                codigo, delta = movimiento.split(':')
+                deltas[int(codigo)] = deltas.get(int(codigo), 0) + int(delta)
+            cambios += len(movimientos)
+    return deltas, cambios
+
+def bloquear_directorio(directorio):
+    '''
+    Toma el bloqueo exclusivo del directorio del journal y devuelve el descriptor del archivo de bloqueo
+    (el sistema lo suelta solo si el proceso termina). Lanza RuntimeError si otro proceso o buffer lo tiene
+    '''
+    descriptor = os.open(os.path.join(directorio, '.bloqueo'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if platform.system() == 'Windows':
+            msvcrt.locking(descriptor, msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(descriptor)
+        raise RuntimeError(f'El directorio {directorio} ya lo usa otra escritura diferida del stock')
+    return descriptor
+
+def desbloquear_directorio(descriptor):
+    if platform.system() == 'Windows':
+        os.lseek(descriptor, 0, os.SEEK_SET)
+        msvcrt.locking(descriptor, msvcrt.LK_UNLCK, 1)
+    os.close(descriptor) ### En el resto de los sistemas cerrar el descriptor suelta el flock
+
+def sincronizar_directorio(directorio):
+    '''
+    fsync del directorio: sin esto, tras un corte de luz un journal recién creado puede desaparecer
+    o uno ya borrado volver a aparecer. En Windows no se puede abrir un directorio (NTFS ya registra esos cambios)
+    '''
+    if platform.system() == 'Windows':
+        return
+    descriptor = os.open(directorio, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+def con_stock_pendiente(producto, pendientes):
+    '''
+    Devuelve el producto con los ajustes pendientes sumados a la cantidad.
+    Si hay que cambiarla se devuelve una copia: el objeto original puede estar en la cache
+    '''
+    if producto is None or not pendientes.get(producto.codigo):
+        return producto
+    producto = copy.copy(producto)
+    producto.cantidad = producto.cantidad + pendientes[producto.codigo]
+    return producto
+
+class BufferStock():
+    def __init__(self, gestion, intervalo_ms=100, max_cambios=500, directorio='stock_diferido') -> None:
+        self.gestion = gestion
+        self.intervalo = intervalo_ms / 1000
+        self.max_cambios = max_cambios
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self._bloqueo = bloquear_directorio(directorio) ### Antes de leer el journal: los lotes de otro dueño no se tocan
+
+        self._condicion = threading.Condition()
+        self._lock_vaciado = threading.Lock() ### Un solo vaciado a la vez (del hilo de fondo o de vaciar())
+        self._lock_fsync = threading.Lock() ### Un fsync del journal alcanza para todos los renglones escritos antes
+        self._escritos = 0 ### Renglones escritos en el journal
+        self._sincronizados = 0 ### Renglones que ya están en disco (fsync)
+        self._actual = {} ### Ajustes del lote que se está llenando
+        self._cambios_actual = 0
+        self._nombre_actual = None
+        self._journal = None ### Descriptor del journal del lote actual (se abre con el primer ajuste)
+        self._por_aplicar = collections.deque() ### Lotes cerrados que todavía no se guardaron, en orden
+        self._confirmados = [] ### Lotes guardados cuyo journal ya se borró: se quitan de stocklote en el próximo vaciado
+        self._generacion = 0 ### Aumenta cada vez que un lote se guarda en la BBDD
+        self._aplicando = False ### Entre el commit de un lote y quitarlo de los pendientes
+        self._cerrado = False
+
+        self._cambios = 0
+        self._filas = 0
+        self._vaciados = 0
+        self._errores = 0
+        self._latencia = Histograma()
+
+        try:
+            self._recuperar()
+        except BaseException:
+            desbloquear_directorio(self._bloqueo)
+            raise
+        self._hilo = threading.Thread(target=self._trabajar, name='stock-diferido', daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, f'{nombre}.journal')
+
+    def _recuperar(self):
+        '''
+        Encola los lotes que quedaron en el journal de una ejecución anterior (los nombres ordenan por fecha)
+        '''
+        for archivo in sorted(os.listdir(self.directorio)):
+            nombre, extension = os.path.splitext(archivo)
+            if extension == '.journal':
+                deltas, cambios = leer_journal(self._ruta(nombre))
+                self._por_aplicar.append(Lote(nombre, deltas, cambios, recuperado=True))
+                self._cambios += cambios
+        if self._por_aplicar:
+            print(f'Se recuperaron {len(self._por_aplicar)} lotes de stock sin guardar del journal')
+            self.vaciar()
+
+    def _trabajar(self):
+        while True:
+            with self._condicion:
+                self._condicion.wait_for(lambda: self._cerrado or self._cambios_actual >= self.max_cambios, timeout=self.intervalo)
+                if self._cerrado:
+                    return
+            self.vaciar()
+
+    def _pendientes(self):
+        '''
+        Suma de los ajustes todavía no guardados, por código (llamar con self._condicion tomado)
+        '''
+        pendientes = dict(self._actual)
+        for lote in self._por_aplicar:
+            for codigo, delta in lote.deltas.items():
+                pendientes[codigo] = pendientes.get(codigo, 0) + delta
+        return pendientes
+
+    def _leer_estable(self, leer):
+        '''
+        Ejecuta leer() y devuelve (resultado, generación) sólo si mientras tanto no se guardó ningún lote
+        (si no, vuelve a leer): así el resultado y los pendientes de esa generación no cuentan dos veces lo mismo
+        '''
+        while True:
+            with self._condicion:
+                self._condicion.wait_for(lambda: not self._aplicando)
+                generacion = self._generacion
+            resultado = leer()
+            with self._condicion:
+                if generacion == self._generacion and not self._aplicando:
+                    return resultado, generacion
+
+    def consultar(self, leer):
+        '''
+        Ejecuta leer() (una lectura de la BBDD o de la cache) y devuelve (resultado, {codigo: delta pendiente})
+        tomados en un mismo momento
+        '''
+        while True:
+            resultado, generacion = self._leer_estable(leer)
+            with self._condicion:
+                if generacion == self._generacion:
+                    return resultado, self._pendientes()
+
+    def _leer_cantidades(self, codigos):
+        connection = self.gestion.connect()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                marcadores = ', '.join(['%s'] * len(codigos))
+                cursor.execute(f'SELECT codigo, cantidad FROM producto WHERE codigo IN ({marcadores})', [str(codigo) for codigo in codigos])
+                return {int(codigo): cantidad for codigo, cantidad in cursor.fetchall()}
+        finally:
+            self.gestion._cerrar(connection)
+
+    def ajustar(self, movimientos):
+        '''
+        Anota los movimientos [(codigo, delta), ...] de un ticket: o se aceptan todos o ninguno
+        (si falta algún producto o alguno quedaría con stock negativo contando los ajustes pendientes).
+        Vuelve cuando quedaron en el journal, sin esperar a la BBDD.
+        Devuelve {codigo: nueva cantidad} o None si no se aceptaron
+        '''
+        deltas = {}
+        for codigo, delta in movimientos:
+            deltas[int(codigo)] = deltas.get(int(codigo), 0) + int(delta)
+        if not deltas:
+            return {}
+
+        while True:
+            try:
+                cantidades, generacion = self._leer_estable(lambda: self._leer_cantidades(list(deltas)))
+            except Error as e:
+                print(f'Error al ajustar el stock: {e}')
+                return None
+            if cantidades is None:
+                return None
+
+            faltantes = [str(codigo) for codigo in deltas if codigo not in cantidades]
+            if faltantes:
+                print(f'Productos inexistentes: {", ".join(faltantes)}')
+                return None
+
+            with self._condicion:
+                if generacion != self._generacion or self._aplicando: ### Se guardó un lote después de leer: las cantidades ya no sirven
+                    continue
+                if self._cerrado:
+                    print('La escritura diferida del stock está cerrada')
+                    return None
+                ### Con los pendientes de ahora (incluye lo que otros hilos anotaron después de la lectura)
+                pendientes = self._pendientes()
+                nuevas = {codigo: cantidades[codigo] + pendientes.get(codigo, 0) + delta for codigo, delta in deltas.items()}
+                insuficientes = [str(codigo) for codigo, cantidad in nuevas.items() if cantidad < 0]
+                if insuficientes:
+                    print(f'Stock insuficiente para: {", ".join(insuficientes)}')
+                    return None
+
+                if self._journal is None:
+                    self._nombre_actual = f'{time.time_ns():016x}-{uuid.uuid4().hex[:15]}'
+                    self._journal = os.open(self._ruta(self._nombre_actual), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                    sincronizar_directorio(self.directorio) ### Que el archivo nuevo sobreviva a un corte, no sólo su contenido
+                ### Un renglón por ticket, escrito de una vez: al recuperar se aplica entero o no se aplica
+                os.write(self._journal, (' '.join(f'{codigo}:{delta}' for codigo, delta in deltas.items()) + '\n').encode('utf-8'))
+                self._escritos += 1
+                renglon = self._escritos
+
+                for codigo, delta in deltas.items():
+                    self._actual[codigo] = self._actual.get(codigo, 0) + delta
+                self._cambios_actual += len(movimientos)
+                self._cambios += len(movimientos)
+                if self._cambios_actual >= self.max_cambios:
+                    self._condicion.notify_all()
+
+            self._sincronizar(renglon)
+            return nuevas
+
+    def _sincronizar(self, renglon):
+        '''
+        Espera a que el renglón del journal esté en disco. Mientras un hilo hace fsync los demás esperan
+        y, si su renglón ya quedó incluido, vuelven sin hacer otro (commit agrupado del journal)
+        '''
+        with self._lock_fsync:
+            with self._condicion:
+                if self._sincronizados >= renglon:
+                    return
+                journal = self._journal
+                escritos = self._escritos
+            os.fsync(journal)
+            with self._condicion:
+                self._sincronizados = max(self._sincronizados, escritos)
+
+    def _cerrar_lote_actual(self):
+        '''
+        Pasa el lote que se está llenando a la cola de lotes por guardar (llamar con self._condicion tomado)
+        '''
+        if self._journal is None:
+            return
+        os.fsync(self._journal)
+        self._sincronizados = self._escritos
+        os.close(self._journal)
+        self._por_aplicar.append(Lote(self._nombre_actual, self._actual, self._cambios_actual))
+        self._journal = None
+        self._nombre_actual = None
+        self._actual = {}
+        self._cambios_actual = 0
+
+    def vaciar(self):
+        '''
+        Guarda en la BBDD todos los ajustes anotados hasta ahora, un lote por transacción y en orden.
+        Devuelve False si algún lote no se pudo guardar (queda en la cola y en el journal para el próximo intento)
+        '''
+        with self._lock_vaciado:
+            with self._lock_fsync, self._condicion: ### Que nadie esté haciendo fsync del journal que se cierra
+                self._cerrar_lote_actual()
+                lotes = list(self._por_aplicar)
+
+            for lote in lotes:
+                if not self._aplicar(lote):
+                    return False
+                os.remove(self._ruta(lote.nombre))
+                ### El renglón de stocklote se borra en el próximo lote: antes el borrado del journal tiene que estar en disco,
+                ### si no un corte podría devolverlo sin marca y se aplicaría dos veces
+                sincronizar_directorio(self.directorio)
+                self._confirmados.append(lote.nombre)
+            return True
+
+    def _aplicar(self, lote):
+        inicio = time.perf_counter()
+        filas = sorted((str(codigo), delta) for codigo, delta in lote.deltas.items() if delta) ### En orden de código, como ajustar_stock_lote
+        connection = self.gestion.connect()
+        if not connection:
+            self._errores += 1
+            return False
+
+        guardado = False
+        try:
+            with connection.cursor() as cursor:
+                if lote.recuperado:
+                    cursor.execute('SELECT lote FROM stocklote WHERE lote = %s', (lote.nombre,))
+                    if cursor.fetchone(): ### Se guardó pero el corte fue antes de borrar el journal
+                        filas = []
+                        lote.deltas = {}
+
+                if lote.deltas or not lote.recuperado:
+                    if filas:
+                        cursor.executemany('UPDATE producto SET cantidad = cantidad + %s WHERE codigo = %s',
+                                           [(delta, codigo) for codigo, delta in filas])
+                    cursor.execute('INSERT INTO stocklote (lote) VALUES (%s)', (lote.nombre,))
+                    self.gestion._registrar_cambios(cursor, [codigo for codigo, _ in filas])
+                if self._confirmados:
+                    marcadores = ', '.join(['%s'] * len(self._confirmados))
+                    cursor.execute(f'DELETE FROM stocklote WHERE lote IN ({marcadores})', self._confirmados)
+
+                with self._condicion:
+                    self._aplicando = True ### Las lecturas esperan hasta que el lote deje de contarse como pendiente
+                try:
+                    connection.commit()
+                    guardado = True
+                    self._confirmados = []
+                    for codigo, _ in filas:
+                        self.gestion._invalidar_cache(codigo)
+                finally:
+                    with self._condicion:
+                        if guardado:
+                            self._por_aplicar.popleft()
+                            self._generacion += 1
+                        self._aplicando = False
+                        self._condicion.notify_all()
+        except Error as e:
+            connection.rollback()
+            self._errores += 1
+            print(f'Error al guardar los ajustes de stock diferidos: {e}')
+            return False
+        finally:
+            self.gestion._cerrar(connection)
+
+        self._vaciados += 1
+        self._filas += len(filas)
+        self._latencia.agregar((time.perf_counter() - inicio) * 1000)
+        return True
+
+    def cerrar(self):
+        '''
+        Detiene el hilo de fondo y guarda lo pendiente (se llama sola al terminar el proceso)
+        '''
+        with self._condicion:
+            if self._cerrado:
+                return
+            self._cerrado = True
+            self._condicion.notify_all()
+        self._hilo.join()
+        if self.vaciar():
+            self._borrar_confirmados()
+        desbloquear_directorio(self._bloqueo)
+        atexit.unregister(self.cerrar)
+
+    def _borrar_confirmados(self):
+        '''
+        Quita de stocklote los lotes guardados cuyo journal ya se borró (los demás vaciados lo hacen en la misma
+        transacción que el lote siguiente; al cerrar no hay siguiente)
+        '''
+        if not self._confirmados:
+            return
+        connection = self.gestion.connect()
+        if not connection:
+            return
+        try:
+            with connection.cursor() as cursor:
+                marcadores = ', '.join(['%s'] * len(self._confirmados))
+                cursor.execute(f'DELETE FROM stocklote WHERE lote IN ({marcadores})', self._confirmados)
+            connection.commit()
+            self._confirmados = []
+        except Error as e:
+            connection.rollback()
+            print(f'Error al limpiar los lotes de stock guardados: {e}')
+        finally:
+            self.gestion._cerrar(connection)
+
+    def estadisticas(self):
+        '''
+        Ajustes recibidos, filas escritas en la BBDD, coalescencia (ajustes por fila escrita),
+        vaciados, errores, ajustes pendientes y latencia de cada vaciado (ms)
+        '''
+        with self._condicion:
+            pendientes = self._cambios_actual + sum(lote.cambios for lote in self._por_aplicar)
+        guardados = self._cambios - pendientes
+        return {
+            'cambios': self._cambios,
+            'pendientes': pendientes,
+            'filas_escritas': self._filas,
+            'coalescencia': guardados / self._filas if self._filas else 0.0,
+            'vaciados': self._vaciados,
+            'errores': self._errores,
+            'latencia_vaciado': self._latencia.resumen(),
+        }